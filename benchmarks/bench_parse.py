@@ -0,0 +1,133 @@
+"""
+    scraper()のページparseにかかる時間を、以前のhtml.parserでの実装とpage_parserで比べる。
+
+    使い方:
+        # 同梱のfixturesで計る
+        python benchmarks/bench_parse.py [--repeat 5]
+        # crawlしたページストアで計る
+        python benchmarks/bench_parse.py --store crawl_exports/pages.sqlite3 [--players crawl_exports/player_name_draft_year_colleges.csv]
+
+    --storeを渡さない場合は、同梱のfixtures(stub_serverが配るファイル。combine_results/, college_stats/,
+    player_name_draft_year_colleges.csv)を読む。crawlしたページはページストアにしかないので、--storeで渡すこと。
+"""
+
+# Imports
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+from bs4 import BeautifulSoup as bs
+from bs4 import Comment
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from page_parser import parse_combine_page, parse_stats_page  # noqa: E402
+from page_store import get_store, KIND_COMBINE, KIND_STATS  # noqa: E402
+from player_identity import player_key  # noqa: E402
+
+fixtures_path = os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), 'fixtures')
+
+
+def legacy_parse(combine_content, stats_content):
+    """
+        以前のscraper()と同じ方法でparseする。
+    """
+    combine_stat_soup = bs(combine_content, 'html.parser')
+    stats = combine_stat_soup.select_one(
+        "table[class='tableperc']").select('tr')
+    combine = [[td.get_text() for td in stat.select('td')] for stat in stats]
+
+    stats_soup = bs(stats_content, 'html.parser')
+    meta = str(stats_soup.find(id='meta'))
+    receiving = None
+    if stats_soup.find(id='receiving') is not None:
+        receiving = (stats_soup.find(id='receiving').select_one('tbody').select('tr')[-1].select('td')[7].get_text(),
+                     stats_soup.find(id='receiving').select_one('tfoot').select('td')[7].get_text())
+    kick_ret_table = None
+    for comment in stats_soup.find_all(string=lambda text: isinstance(text, Comment)):
+        kick_ret_table = bs(str(comment), 'html.parser').find(id='kick_ret')
+        if kick_ret_table:
+            break
+    return combine, meta, receiving, kick_ret_table
+
+
+def lxml_parse(combine_content, stats_content):
+    return parse_combine_page(combine_content), parse_stats_page(stats_content)
+
+
+def load_fixture_pages(data_dir=fixtures_path):
+    """
+        fixturesのフォルダから (Combineのページ, 戦績のページ) の配列を読む。
+    """
+    name_year_df = pd.read_csv(os.path.join(
+        data_dir, 'player_name_draft_year_colleges.csv'))
+    pages = list()
+    for player_name, draft_year in zip(name_year_df.Player_Name, name_year_df.Draft_Year):
+        first_name, last_name = player_name.split()[0], player_name.split()[1]
+        combine_file_path = os.path.join(
+            data_dir, 'combine_results', '{}_{}_{}.html'.format(first_name, last_name, draft_year))
+        stats_file_path = os.path.join(data_dir, 'college_stats', '{}-{}-{}-stats.html'.format(
+            first_name.lower(), last_name.lower(), draft_year))
+        if not (os.path.exists(combine_file_path) and os.path.exists(stats_file_path)):
+            continue
+        pages.append((open(combine_file_path, 'r').read(),
+                      open(stats_file_path, mode='r', encoding='ascii', errors='ignore').read()))
+    return pages
+
+
+def load_store_pages(store_path, players_path):
+    """
+        ページストアから、選手一覧のCSVの選手の (Combineのページ, 戦績のページ) の配列を読む。
+    """
+    name_year_df = pd.read_csv(players_path)
+    store = get_store(store_path)
+    pages = list()
+    for player_name, draft_year, college in zip(name_year_df.Player_Name, name_year_df.Draft_Year,
+                                                 name_year_df.College):
+        key = player_key(player_name, draft_year, college)
+        combine_content, stats_content = store.get(KIND_COMBINE, key), store.get(KIND_STATS, key)
+        if combine_content is None or stats_content is None:
+            continue
+        pages.append((combine_content, stats_content))
+    return pages
+
+
+def time_per_player(parse, pages, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for combine_content, stats_content in pages:
+            parse(combine_content, stats_content)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(pages) * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--store', default=None,
+                        help='page store to read crawled pages from (default: the bundled fixtures)')
+    parser.add_argument('--players', default='./crawl_exports/player_name_draft_year_colleges.csv',
+                        help='player list CSV used to look up pages in --store')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    if args.store is not None:
+        pages = load_store_pages(args.store, args.players)
+    else:
+        pages = load_fixture_pages()
+    if not pages:
+        sys.exit('no pages found in {}'.format(args.store or fixtures_path))
+
+    before = time_per_player(legacy_parse, pages, args.repeat)
+    after = time_per_player(lxml_parse, pages, args.repeat)
+    print('players: {}'.format(len(pages)))
+    print('html.parser: {:.2f} ms/player'.format(before))
+    print('lxml:        {:.2f} ms/player'.format(after))
+    print('speedup:     {:.1f}x'.format(before / after))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""
+    記録したカセットを replay_server.ReplayServer で再生し、crawlerのスループットを計るベンチマーク。
+    fetcherの同時リクエスト数(--workers)ごとに、選手一覧、ドラフトページ、詳細ページのcrawlを1回ずつ実行する。
+    サーバー側の遅延、エラーの注入、レート制限を変えながら、ネットワークなしでcrawlerの設定を調整できる。
+
+    エラーの注入は詳細ページのcrawlにだけかける。(選手一覧とドラフトページは1ページずつなので、スループットの比較に入れない)
+
+    使い方:
+        # benchmarks/fixtures をスタブサーバーからcrawlしてカセットに記録し、それを再生する
+        python benchmarks/bench_replay.py --from-fixtures --workers 1,4,8 --latency-ms 50 --error-rate 0.05
+
+        # crawl --record で記録したカセットを再生する(URLはcrawlerのデフォルト)
+        python benchmarks/bench_replay.py crawl_exports/cassette.sqlite3 --workers 4,8,16 --rate 2 --host-rate 2
+"""
+
+# Imports
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from urllib.parse import urlsplit
+
+benchmarks_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(benchmarks_path, '..'))
+import crawler  # noqa: E402
+from cassette import Cassette  # noqa: E402
+from http_session import get_session  # noqa: E402
+from metrics import metrics as run_metrics  # noqa: E402
+from page_store import PageStore  # noqa: E402
+from replay_server import ReplayServer  # noqa: E402
+from stub_server import StubServer, fixtures_path  # noqa: E402
+
+
+def crawl_once(index_url, draft_url, stats_base_url, workers=None, rates=None, before_detail_pages=None):
+    """
+        カレントディレクトリに、ドラフトページ、選手一覧、詳細ページを1回crawlし、選手の数を返す。
+    """
+    crawler.college_stats_base_url = stats_base_url
+    crawler.draft_page_crawler(draft_url)
+    players = crawler.get_show_urls_and_draft_year(index_url)
+    if before_detail_pages is not None:
+        before_detail_pages()
+    store = PageStore(os.path.join('crawl_exports', 'pages.sqlite3'))
+    try:
+        asyncio.run(crawler.crawl_detail_pages(*players, max_workers=workers, rates=rates, store=store))
+    finally:
+        store.close()
+    return len(players[0])
+
+
+def record_fixtures(cassette_path, data_dir=fixtures_path):
+    """
+        fixturesのスタブサーバーをcrawlしてカセットに記録し、(一覧のURL, ドラフトページのURL, 戦績ページのベースURL) を返す。
+    """
+    session = get_session()
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as work_dir, StubServer(data_dir) as server:
+        urls = (server.base_url + 'nflcombinedata.php?year=all&pos=WR&college=',
+                server.base_url + 'play-index/draft-finder.cgi?request=1',
+                server.base_url + 'cfb/players/')
+        os.chdir(work_dir)
+        session.cassette = Cassette(cassette_path)
+        try:
+            crawl_once(*urls, rates={'127.0.0.1': 10000.0})
+        finally:
+            session.cassette.close()
+            session.cassette = None
+            os.chdir(cwd)
+    return urls
+
+
+def counter_total(name):
+    return sum(value for (counter, _), value in run_metrics.snapshot()['counters'].items() if counter == name)
+
+
+def run(cassette_path, urls, workers_list, latency_ms=0, error_rate=0.0, rate=0.0, host_rate=None, seed=0):
+    """
+        --workersの値ごとに再生したcrawlの結果のdictを返す。
+    """
+    # host_rateを指定しなければfetcher.host_ratesのペースで送る。
+    rates = None if host_rate is None else {urlsplit(url).hostname: host_rate for url in urls}
+    session = get_session()
+    cwd = os.getcwd()
+    result = dict()
+    with ReplayServer(cassette_path, latency_ms=latency_ms, rate=rate, seed=seed) as server:
+        session.replay_base_url, session.cache_path = server.base_url, None
+        try:
+            for workers in workers_list:
+                run_metrics.reset()
+                server.requests = server.injected_errors = server.throttled = server.misses = 0
+                server.error_rate = 0.0
+                server._buckets.clear()
+
+                def inject_errors():
+                    server.error_rate = error_rate
+
+                with tempfile.TemporaryDirectory() as work_dir:
+                    os.chdir(work_dir)
+                    try:
+                        start = time.perf_counter()
+                        players = crawl_once(*urls, workers=workers, rates=rates, before_detail_pages=inject_errors)
+                        elapsed = time.perf_counter() - start
+                    finally:
+                        os.chdir(cwd)
+                result[workers] = {
+                    'seconds': elapsed,
+                    'players': players,
+                    'players_per_sec': players / elapsed,
+                    'requests': server.requests,
+                    'retries': counter_total('http_retries_total'),
+                    'injected_503': server.injected_errors,
+                    'throttled_429': server.throttled,
+                    'unrecorded_404': server.misses,
+                }
+        finally:
+            session.replay_base_url = None
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure crawler throughput against a replayed cassette.')
+    parser.add_argument('cassette', nargs='?', default=None,
+                        help='cassette written by crawl --record')
+    parser.add_argument('--from-fixtures', action='store_true',
+                        help='record a cassette from benchmarks/fixtures first and replay that')
+    parser.add_argument('--index-url', default=crawler.combine_index_url)
+    parser.add_argument('--draft-url', default=crawler.draft_table_url)
+    parser.add_argument('--stats-base-url', default=crawler.college_stats_base_url)
+    parser.add_argument('--workers', default='8',
+                        help='comma separated fetcher max_workers values to compare')
+    parser.add_argument('--host-rate', type=float, default=None,
+                        help='requests per second the fetcher starts with for every host (default: fetcher.host_rates)')
+    parser.add_argument('--latency-ms', type=float, default=0,
+                        help='delay the replay server adds to every response')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='fraction of detail page requests answered with 503')
+    parser.add_argument('--rate', type=float, default=0.0,
+                        help='requests per second per host the replay server allows before answering 429')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', default=None,
+                        help='also write the report to this JSON file')
+    args = parser.parse_args(argv)
+
+    workers_list = [int(workers) for workers in args.workers.split(',')]
+    with tempfile.TemporaryDirectory() as cassette_dir:
+        if args.from_fixtures:
+            cassette_path = os.path.join(cassette_dir, 'cassette.sqlite3')
+            urls = record_fixtures(cassette_path)
+            # fixturesのカセットはスタブサーバーのペースで記録したので、fetcherのペースも制限しない。
+            host_rate = args.host_rate or 10000.0
+        elif args.cassette is not None:
+            cassette_path = args.cassette
+            urls = (args.index_url, args.draft_url, args.stats_base_url)
+            host_rate = args.host_rate
+        else:
+            parser.error('pass a cassette or --from-fixtures')
+        result = run(cassette_path, urls, workers_list, args.latency_ms, args.error_rate,
+                     args.rate, host_rate, args.seed)
+
+    print('{:>8} {:>9} {:>12} {:>9} {:>8} {:>8} {:>8} {:>8}'.format(
+        'workers', 'seconds', 'players/sec', 'requests', 'retries', '503', '429', '404'))
+    for workers, row in result.items():
+        print('{:>8} {:>9.2f} {:>12.2f} {:>9} {:>8} {:>8} {:>8} {:>8}'.format(
+            workers, row['seconds'], row['players_per_sec'], row['requests'], row['retries'],
+            row['injected_503'], row['throttled_429'], row['unrecorded_404']))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
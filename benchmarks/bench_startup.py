@@ -0,0 +1,95 @@
+"""
+    コマンドの起動時間(コールドスタート)のベンチマーク。
+    コマンドごとに新しいPythonのプロセスを立ち上げて、終わるまでの時間の最小値と中央値を計る。
+    あわせて、そのコマンドがpandas、bs4、lxml、tqdmを読み込んだかどうかも出す。
+
+        status:          python -m nflcombine status (crawlの進み具合を見るだけの軽いコマンド)
+        help:            python -m nflcombine --help
+        crawl --help:    python -m nflcombine crawl --help (crawlerをimportする)
+        scrape --help:   python -m nflcombine scrape --help (scraperとpage_parserをimportする)
+        pipeline --help: python -m nflcombine pipeline --help
+        import crawler:  python -c "import crawler"
+        import scraper:  python -c "import scraper"
+
+    使い方:
+        python benchmarks/bench_startup.py [--repeat 10] [--json report.json]
+"""
+
+# Imports
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+repo_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+heavy_modules = ['pandas', 'bs4', 'lxml', 'tqdm']
+
+# コマンドの名前 → 実行するコード。実行した後に読み込まれていた重いモジュールを出力する。
+commands = {
+    'status': "from nflcombine.__main__ import main; main(['status'])",
+    'help': "from nflcombine.__main__ import main\ntry:\n    main(['--help'])\nexcept SystemExit:\n    pass",
+    'crawl --help': "from nflcombine.__main__ import main\ntry:\n    main(['crawl', '--help'])\nexcept SystemExit:\n    pass",
+    'scrape --help': "from nflcombine.__main__ import main\ntry:\n    main(['scrape', '--help'])\nexcept SystemExit:\n    pass",
+    'pipeline --help': "from nflcombine.__main__ import main\ntry:\n    main(['pipeline', '--help'])\nexcept SystemExit:\n    pass",
+    'import crawler': 'import crawler',
+    'import scraper': 'import scraper',
+}
+loaded_report = "\nimport sys\nprint('loaded:' + ','.join(m for m in {} if m in sys.modules), file=sys.stderr)"
+
+
+def run_command(code, work_dir):
+    """
+        新しいプロセスでcodeを実行し、(かかった秒数, 読み込まれた重いモジュールの配列) を返す。
+    """
+    env = dict(os.environ, PYTHONPATH=repo_path)
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, '-c', code + loaded_report.format(heavy_modules)],
+                               cwd=work_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                               text=True, check=True)
+    elapsed = time.perf_counter() - start
+    loaded = completed.stderr.strip().splitlines()[-1].split(':', 1)[1]
+    return elapsed, [name for name in loaded.split(',') if name]
+
+
+def run(repeat=10, work_dir=None):
+    """
+        コマンドごとに {'min_ms', 'median_ms', 'loaded'} のdictを返す。
+    """
+    work_dir = work_dir or repo_path
+    result = dict()
+    for name, code in commands.items():
+        # 1回目はバイトコードのキャッシュを作るために捨てる。
+        run_command(code, work_dir)
+        timings = list()
+        for _ in range(repeat):
+            elapsed, loaded = run_command(code, work_dir)
+            timings.append(elapsed * 1000)
+        result[name] = {'min_ms': min(timings), 'median_ms': statistics.median(timings), 'loaded': loaded}
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure cold-start time of the command line entry points.')
+    parser.add_argument('--repeat', type=int, default=10,
+                        help='number of timed launches per command')
+    parser.add_argument('--work-dir', default=None,
+                        help='directory to run the commands in (default: the repository)')
+    parser.add_argument('--json', default=None,
+                        help='also write the report to this JSON file')
+    args = parser.parse_args(argv)
+
+    result = run(args.repeat, args.work_dir)
+    print('{:<16} {:>8} {:>10}  {}'.format('command', 'min ms', 'median ms', 'heavy modules loaded'))
+    for name, timing in result.items():
+        print('{:<16} {:>8.1f} {:>10.1f}  {}'.format(name, timing['min_ms'], timing['median_ms'],
+                                                   ', '.join(timing['loaded']) or '-'))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+"""
+    crawlerとscraperのホットパスのベンチマーク。ネットワークにはつながず、benchmarks/fixtures のページで計測する。
+
+        crawl:  stub_server.StubServer に対して、選手一覧(get_show_urls_and_draft_year)、ドラフトページ、
+                Combineの詳細ページと大学時代の戦績ページ(crawl_detail_pages)をcrawlする。
+        scrape: crawlしたページストアから、フェーズごとの時間を計る。
+                    store_read: ページストアから2つのページを読む
+                    combine_parse: page_parser.parse_combine_page
+                    stats_parse: page_parser.parse_stats_page
+                    draft_lookup: draft_index.DraftIndex.lookup
+                    scraper: scraper.scrape_batch() 全体 (レコードのキャッシュなし)
+                    scraper_cached: ページが変わっていないときの scraper.scrape_batch() (全員record_cacheから読む)
+                scrape_batch() 全体の時間から players/sec を出す。
+
+    最後にプロセスのピークRSSを出力する。
+
+    使い方:
+        python benchmarks/bench_suite.py [--repeat 20] [--json report.json]
+        python benchmarks/bench_suite.py --save-baseline      # 今の結果を benchmarks/baseline.json に保存する
+        python benchmarks/bench_suite.py --check [--tolerance 0.2]
+            players/sec がベースラインから tolerance より下がっていたら終了コード1で終わる。
+
+    ベースラインはマシンによって変わるので、比べるマシンで --save-baseline してから使うこと。
+"""
+
+# Imports
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+benchmarks_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(benchmarks_path, '..'))
+import crawler  # noqa: E402
+# crawlerはpandasとbs4を使う関数の中でimportするので、そのimport時間がcrawlの計測に入らないように先に読み込んでおく。
+# (起動時間は bench_startup.py で計る)
+import bs4  # noqa: E402,F401
+import pandas  # noqa: E402,F401
+from draft_index import get_draft_index, load_or_build_draft_index  # noqa: E402
+from draft_index import index_path as draft_index_path  # noqa: E402
+from page_parser import parse_combine_page, parse_stats_page  # noqa: E402
+from page_store import get_store, KIND_COMBINE, KIND_STATS  # noqa: E402
+from page_store import store_path  # noqa: E402
+from player_identity import player_key  # noqa: E402
+from scraper import scrape_batch  # noqa: E402
+from stub_server import StubServer, fixtures_path  # noqa: E402
+
+baseline_path = os.path.join(benchmarks_path, 'baseline.json')
+# --checkで比べる値。大きいほど速い。
+throughput_metrics = ['crawl_players_per_sec', 'scrape_players_per_sec']
+
+
+def peak_rss_mb():
+    """
+        このプロセスのピークRSS(MB)。resourceモジュールがないOSではNone。
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOSはバイト、Linuxはキロバイトで返す。
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def best_of(repeat, func):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_crawl(server, workers):
+    """
+        スタブサーバーから全てのページをcrawlし、フェーズごとの時間(秒)と選手の一覧を返す。
+        カレントディレクトリのcrawl_exportsに保存されるので、呼び出す前に作業用のフォルダに移っておくこと。
+    """
+    crawler.college_stats_base_url = server.base_url + 'cfb/players/'
+    result = dict()
+
+    start = time.perf_counter()
+    players = crawler.get_show_urls_and_draft_year(server.base_url + 'nflcombinedata.php?year=all&pos=WR&college=')
+    result['crawl_index_s'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    crawler.draft_page_crawler(server.base_url + 'play-index/draft-finder.cgi?request=1')
+    result['crawl_draft_page_s'] = time.perf_counter() - start
+
+    # スタブサーバーにはレート制限をかけない。
+    start = time.perf_counter()
+    asyncio.run(crawler.crawl_detail_pages(*players, max_workers=workers, rates={'127.0.0.1': 10000.0}))
+    result['crawl_detail_pages_s'] = time.perf_counter() - start
+
+    total = result['crawl_index_s'] + result['crawl_draft_page_s'] + result['crawl_detail_pages_s']
+    result['crawl_players_per_sec'] = len(players[0]) / total
+    return result, players
+
+
+def bench_scrape(players, repeat):
+    """
+        crawlしたページストアから、フェーズごとの1選手あたりの時間(ミリ秒)を返す。
+    """
+    _, names, years, colleges = players
+    players = [(int(year), name, college) for name, year, college in zip(names, years, colleges)]
+    store = get_store(store_path)
+    load_or_build_draft_index()
+    draft_index = get_draft_index(draft_index_path)
+    keys = [player_key(name, year, college) for year, name, college in players]
+    pages = [(store.get(KIND_COMBINE, key), store.get(KIND_STATS, key)) for key in keys]
+
+    phases = {
+        'store_read': lambda: [(store.get(KIND_COMBINE, key), store.get(KIND_STATS, key)) for key in keys],
+        'combine_parse': lambda: [parse_combine_page(combine_content) for combine_content, _ in pages],
+        'stats_parse': lambda: [parse_stats_page(stats_content) for _, stats_content in pages],
+        'draft_lookup': lambda: [draft_index.lookup(name, year, college) for year, name, college in players],
+        'scraper': lambda: scrape_batch(players, cache_path=None),
+        # 1回目でキャッシュに入るので、ページが変わっていない夜間の更新の時間になる。
+        'scraper_cached': lambda: scrape_batch(players),
+    }
+    result = dict()
+    for phase, func in phases.items():
+        result[phase + '_ms'] = best_of(repeat, func) / len(players) * 1000
+    result['scrape_players_per_sec'] = 1000 / result['scraper_ms']
+    return result
+
+
+def run(repeat=20, workers=None, latency_ms=0, data_dir=fixtures_path):
+    """
+        作業用の一時フォルダでcrawlとscrapeのベンチマークを実行し、結果をdictで返す。
+    """
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as work_dir, StubServer(data_dir, latency_ms=latency_ms) as server:
+        os.chdir(work_dir)
+        try:
+            result, players = bench_crawl(server, workers)
+            result['players'] = len(players[0])
+            result['requests'] = server.requests
+            result.update(bench_scrape(players, repeat))
+            get_store(store_path).close()
+        finally:
+            os.chdir(cwd)
+    result['peak_rss_mb'] = peak_rss_mb()
+    return result
+
+
+def check_against_baseline(result, baseline, tolerance):
+    """
+        ベースラインよりtoleranceの割合以上遅くなった値の説明の配列を返す。
+    """
+    regressions = list()
+    for metric in throughput_metrics:
+        if metric not in baseline:
+            continue
+        floor = baseline[metric] * (1 - tolerance)
+        if result[metric] < floor:
+            regressions.append('{}: {:.1f} < {:.1f} (baseline {:.1f})'.format(
+                metric, result[metric], floor, baseline[metric]))
+    return regressions
+
+
+def print_report(result, baseline=None):
+    for metric, value in result.items():
+        line = '{:<24} {}'.format(metric, value if not isinstance(value, float) else '{:.3f}'.format(value))
+        if baseline and isinstance(baseline.get(metric), (int, float)) and isinstance(value, float) and baseline[metric]:
+            line += '  ({:+.1f}% vs baseline)'.format((value / baseline[metric] - 1) * 100)
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the crawler and scraper hot paths against recorded fixtures.')
+    parser.add_argument('--data-dir', default=fixtures_path)
+    parser.add_argument('--repeat', type=int, default=20,
+                        help='best-of repeat count for each scrape phase')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='maximum number of concurrent requests while crawling')
+    parser.add_argument('--latency-ms', type=float, default=0,
+                        help='delay the stub server adds to every response')
+    parser.add_argument('--json', default=None,
+                        help='also write the report to this JSON file')
+    parser.add_argument('--baseline', default=baseline_path)
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='store this run as the baseline')
+    parser.add_argument('--check', action='store_true',
+                        help='exit with status 1 when players/sec drops below the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed fractional drop in players/sec for --check')
+    args = parser.parse_args(argv)
+
+    result = run(args.repeat, args.workers, args.latency_ms, args.data_dir)
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(result, f, indent=2)
+        print('saved baseline to {}'.format(args.baseline))
+    if args.check:
+        if baseline is None:
+            sys.exit('no baseline at {}; run with --save-baseline first'.format(args.baseline))
+        regressions = check_against_baseline(result, baseline, args.tolerance)
+        if regressions:
+            sys.exit('throughput regression:\n  ' + '\n  '.join(regressions))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+    crawler --record で記録したカセット(cassette.py)を再生するローカルのサーバー。
+    リクエストのパス "/{ホスト}{パス}?{クエリ}" をカセットのキーにして、記録したレスポンスを返す。
+    記録されていないURLには404を返す。
+
+    stub_server.LocalServerと同じく、遅延、エラーの注入(503)、レート制限(429)をかけられる。
+    レート制限は元のホストごとにかかる。
+
+    使い方:
+        python benchmarks/replay_server.py crawl_exports/cassette.sqlite3 [--port 8765] [--latency-ms 50]
+                                           [--error-rate 0.05] [--rate 2] [--seed 0]
+        python -m nflcombine crawl --replay http://127.0.0.1:8765/
+"""
+
+# Imports
+import argparse
+import os
+import sys
+
+benchmarks_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(benchmarks_path, '..'))
+from cassette import Cassette  # noqa: E402
+from stub_server import LocalServer, add_server_arguments, not_found_body  # noqa: E402
+
+
+class ReplayServer(LocalServer):
+    """
+        parameters:
+            cassette_path: 再生するカセットのパス
+            その他はstub_server.LocalServerと同じ
+    """
+
+    def __init__(self, cassette_path, port=0, latency_ms=0, **kwargs):
+        self.cassette = Cassette(cassette_path)
+        self.misses = 0
+        super().__init__(port, latency_ms, **kwargs)
+
+    def throttle_key(self, path):
+        # パスの最初の部分が元のホスト
+        return path.lstrip('/').split('/', 1)[0]
+
+    def route(self, path):
+        interaction = self.cassette.get(path.lstrip('/'))
+        if interaction is None:
+            with self._lock:
+                self.misses += 1
+            return 404, not_found_body, {}
+        status, headers, body = interaction
+        # Retry-Afterは記録したときのサーバーの状態なので返さない。レート制限は --rate でかける。
+        headers.pop('Retry-After', None)
+        return status, body, headers
+
+    def stop(self):
+        super().stop()
+        self.cassette.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay a recorded crawl cassette as a local server.')
+    parser.add_argument('cassette', help='cassette file written by crawl --record')
+    add_server_arguments(parser)
+    args = parser.parse_args(argv)
+
+    server = ReplayServer(args.cassette, args.port, args.latency_ms,
+                          error_rate=args.error_rate, rate=args.rate, seed=args.seed)
+    print('replaying {} recorded responses from {} on {}'.format(len(server.cassette), args.cassette, server.base_url))
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+"""
+    benchmarks/fixtures のページを返すローカルのスタブサーバー。
+    crawlerをネットワークにつながずに動かすために使う。
+
+        /nflcombinedata.php                 -> combine_index.html (選手詳細ページのリンクはスタブのURLに書き換える)
+        /playerpage.php?i={id}              -> combine_results/{名}_{姓}_{年}.html
+        /cfb/players/{名}-{姓}-1.html       -> college_stats/{名}-{姓}-{年}-stats.html (それ以外の番号は404)
+        /play-index/draft-finder.cgi        -> draft_page.html
+
+    LocalServerは、レスポンスの遅延、エラーの注入(503)、ホストごとのレート制限(429とRetry-After)を持つ
+    ローカルのHTTPサーバー。StubServerと、カセットを再生する replay_server.ReplayServer はこれを使う。
+
+    使い方:
+        python benchmarks/stub_server.py [--port 8765] [--latency-ms 0] [--error-rate 0] [--rate 0]
+"""
+
+# Imports
+import argparse
+import glob
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import lxml.html
+
+fixtures_path = os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), 'fixtures')
+recorded_base_url = 'https://nflcombineresults.com/'
+stats_path_pattern = re.compile(r'^/cfb/players/([a-z]+)-([a-z]+)-(\d+)\.html$')
+not_found_body = b'<html><body>404 error</body></html>'
+
+
+def read_fixture(*parts):
+    with open(os.path.join(*parts), 'rb') as f:
+        return f.read()
+
+
+def combine_pages_by_id(data_dir):
+    """
+        一覧ページのリンクのid → Combineの詳細ページのファイル名 のdictを返す。
+    """
+    tree = lxml.html.fromstring(read_fixture(data_dir, 'combine_index.html'))
+    pages = dict()
+    for row in tree.xpath("//tr[@class='tablefont']"):
+        year = row.xpath('./td')[0].text_content().strip()
+        for a_tag in row.xpath('.//a'):
+            player_id = parse_qs(urlsplit(a_tag.get('href')).query)['i'][0]
+            first_name, last_name = a_tag.text_content().replace('.', '').split()[:2]
+            pages[player_id] = '{}_{}_{}.html'.format(first_name, last_name, year)
+    return pages
+
+
+class LocalServer:
+    """
+        parameters:
+            port: 0の場合は空いているポートを使う
+            latency_ms: レスポンスを返す前に待つ時間
+            error_rate: この割合のリクエストに503を返す
+            rate: レート制限のキー(throttle_key())ごとの1秒あたりのリクエスト数。超えた分には429を返す。0の場合は制限しない。
+            seed: エラーを注入するリクエストを決める乱数のシード
+
+        サブクラスで route() を実装する。
+    """
+
+    def __init__(self, port=0, latency_ms=0, error_rate=0.0, rate=0.0, seed=0):
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.rate = rate
+        self.requests = 0
+        self.injected_errors = 0
+        self.throttled = 0
+        self._random = random.Random(seed)
+        # レート制限のキー → (トークン数, 最後に補充した時刻)
+        self._buckets = dict()
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return 'http://127.0.0.1:{}/'.format(self.httpd.server_address[1])
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if server.latency_ms:
+                    time.sleep(server.latency_ms / 1000)
+                status, body, headers = server.respond(self.path)
+                self.send_response(status)
+                headers.setdefault('Content-Type', 'text/html; charset=utf-8')
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+    def throttle_key(self, path):
+        """
+            レート制限を分ける単位。デフォルトはサーバー全体で1つ。
+        """
+        return ''
+
+    def _take_token(self, key):
+        """
+            トークンバケットからトークンを1つ取る。取れなければFalse。
+        """
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (max(1.0, self.rate), now))
+        tokens = min(max(1.0, self.rate), tokens + (now - updated) * self.rate)
+        if tokens < 1:
+            self._buckets[key] = (tokens, now)
+            return False
+        self._buckets[key] = (tokens - 1, now)
+        return True
+
+    def respond(self, path):
+        """
+            レート制限とエラーの注入をしてから route() を呼び、(ステータスコード, 本文, ヘッダーのdict) を返す。
+        """
+        with self._lock:
+            self.requests += 1
+            if self.rate and not self._take_token(self.throttle_key(path)):
+                self.throttled += 1
+                return 429, b'<html><body>429 Too Many Requests</body></html>', {'Retry-After': '1'}
+            if self.error_rate and self._random.random() < self.error_rate:
+                self.injected_errors += 1
+                return 503, b'<html><body>503 Service Unavailable</body></html>', {}
+        return self.route(path)
+
+    def route(self, path):
+        """
+            リクエストのパスから (ステータスコード, 本文, ヘッダーのdict) を返す。
+        """
+        raise NotImplementedError
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def serve_forever(self):
+        try:
+            self.httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def add_server_arguments(parser):
+    """
+        LocalServerの --port、--latency-ms、--error-rate、--rate、--seed をargparseに加える。
+    """
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=0,
+                        help='delay added to every response')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='fraction of requests answered with 503')
+    parser.add_argument('--rate', type=float, default=0.0,
+                        help='requests per second allowed per host before answering 429 (0 disables)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='random seed for error injection')
+
+
+class StubServer(LocalServer):
+    """
+        parameters:
+            data_dir: fixturesのフォルダ
+            その他はLocalServerと同じ
+    """
+
+    def __init__(self, data_dir=fixtures_path, port=0, latency_ms=0, **kwargs):
+        self.data_dir = data_dir
+        self.combine_pages = combine_pages_by_id(data_dir)
+        super().__init__(port, latency_ms, **kwargs)
+
+    def route(self, path):
+        """
+            リクエストのパスから (ステータスコード, 本文, ヘッダーのdict) を返す。
+        """
+        url = urlsplit(path)
+        if url.path == '/nflcombinedata.php':
+            return 200, read_fixture(self.data_dir, 'combine_index.html').replace(
+                recorded_base_url.encode(), self.base_url.encode()), {}
+        if url.path == '/playerpage.php':
+            file_name = self.combine_pages.get(parse_qs(url.query).get('i', [''])[0])
+            if file_name is not None:
+                return 200, read_fixture(self.data_dir, 'combine_results', file_name), {}
+        if url.path == '/play-index/draft-finder.cgi':
+            return 200, read_fixture(self.data_dir, 'draft_page.html'), {}
+        match = stats_path_pattern.match(url.path)
+        if match and match.group(3) == '1':
+            stats_paths = glob.glob(os.path.join(self.data_dir, 'college_stats', '{}-{}-*-stats.html'.format(
+                match.group(1), match.group(2))))
+            if stats_paths:
+                return 200, read_fixture(stats_paths[0]), {}
+        return 404, not_found_body, {}
+
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve benchmark fixtures as a local stand-in for the crawled sites.')
+    parser.add_argument('--data-dir', default=fixtures_path)
+    add_server_arguments(parser)
+    args = parser.parse_args(argv)
+
+    server = StubServer(args.data_dir, args.port, args.latency_ms,
+                        error_rate=args.error_rate, rate=args.rate, seed=args.seed)
+    print('serving {} on {}'.format(args.data_dir, server.base_url))
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
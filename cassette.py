@@ -0,0 +1,109 @@
+"""
+-----------------------------------------------------------------------
+-- リクエストの記録と再生 ------------------------------------------------
+-----------------------------------------------------------------------
+
+    crawlerが送ったリクエストとレスポンスをカセット(SQLiteファイル)に記録し、ネットワークなしで再生できるようにする。
+
+    記録:   python -m nflcombine crawl --record crawl_exports/cassette.sqlite3
+            http_sessionの共有セッションを通った全てのレスポンス(404も含む)を保存する。
+            304でHTTPキャッシュの本文を使った場合は、その本文を200として保存する。
+    再生:   python benchmarks/replay_server.py crawl_exports/cassette.sqlite3 --port 8765 [--latency-ms 50 --error-rate 0.05 --rate 2]
+            python -m nflcombine crawl --replay http://127.0.0.1:8765/
+            --replay を渡すと、全てのリクエストのURLを "{replay}/{ホスト}{パス}?{クエリ}" に書き換えて送る。
+            ページの中のリンクは元のURLのままでよく、fetcherのホストごとのレート制限も元のホストで効く。
+
+    カセットのキーはスキームを除いた "{ホスト}{パス}?{クエリ}"。同じURLを2回記録した場合は後のものが残る。
+
+-----------------------------------------------------------------------
+-----------------------------------------------------------------------
+
+
+"""
+
+# Imports
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from urllib.parse import urlsplit
+
+# 記録しておくレスポンスのヘッダー
+recorded_headers = ('Content-Type', 'ETag', 'Last-Modified', 'Retry-After')
+
+
+def cassette_key(url):
+    """
+        URLからカセットのキー "{ホスト}{パス}?{クエリ}" を作る。
+    """
+    parts = urlsplit(url)
+    return parts.netloc + (parts.path or '/') + ('?' + parts.query if parts.query else '')
+
+
+def replay_url(replay_base_url, url):
+    """
+        元のURLを、再生サーバーの "{replay_base_url}{ホスト}{パス}?{クエリ}" に書き換える。
+    """
+    return replay_base_url.rstrip('/') + '/' + cassette_key(url)
+
+
+class Cassette:
+    """
+        parameters:
+            path: SQLiteファイルのパス
+
+        fetcherのスレッドプールから同時に呼ばれるので、1つのコネクションをロックで守って使う。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS interactions (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                status INTEGER NOT NULL,
+                headers TEXT NOT NULL,
+                body BLOB NOT NULL,
+                recorded_at REAL NOT NULL
+            )""")
+        self.conn.commit()
+
+    def record(self, url, response):
+        """
+            requests.Responseを保存する。
+        """
+        headers = {name: response.headers[name] for name in recorded_headers if name in response.headers}
+        with self._lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO interactions (key, url, status, headers, body, recorded_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (cassette_key(url), url, response.status_code, json.dumps(headers),
+                 zlib.compress(response.content), time.time()))
+            self.conn.commit()
+
+    def get(self, key):
+        """
+            returns:
+                (ステータスコード, ヘッダーのdict, 本文のbytes)。記録されていなければNone。
+        """
+        with self._lock:
+            row = self.conn.execute('SELECT status, headers, body FROM interactions WHERE key = ?',
+                                    (key,)).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1]), zlib.decompress(row[2])
+
+    def __len__(self):
+        with self._lock:
+            return self.conn.execute('SELECT COUNT(*) FROM interactions').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
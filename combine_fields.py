@@ -0,0 +1,122 @@
+"""
+-----------------------------------------------------------------------
+-- Combineの結果の項目 -------------------------------------------------
+-----------------------------------------------------------------------
+
+    Combineの結果詳細ページ(table.tableperc)の行の見出し → PlayerRecordの属性、単位、型 の対応を宣言しておき、
+    行の位置ではなく見出しで値を拾う。ページの行の並びが変わっても列がずれることはない。
+
+    値の文字列は選手ごとに集めておき、全選手分をまとめてpandasの文字列操作と to_numeric(errors='coerce') で数値にする。
+        '72"' -> 72.0, '205 lbs' -> 205.0, '(N/A)' -> None
+
+    どの項目にも当てはまらない見出しは metrics の combine_unknown_labels_total に数える。
+
+-----------------------------------------------------------------------
+-----------------------------------------------------------------------
+
+
+"""
+
+# Imports
+import re
+from collections import namedtuple
+
+from metrics import metrics
+
+# labels: 見出しの候補(normalize_label()したもの)。ページの見出しがどれかと一致するか、どれかで始まればその項目とする。
+# unit: 値から取り除く単位
+# dtype: 'float' か 'int'
+CombineField = namedtuple('CombineField', ['attribute', 'labels', 'unit', 'dtype'])
+
+combine_fields = [
+    CombineField('height', ('height',), '"', 'float'),
+    CombineField('weight', ('weight',), 'lbs', 'float'),
+    CombineField('hand_size', ('handsize', 'hand'), '"', 'float'),
+    CombineField('arm_length', ('armlength', 'arm'), '"', 'float'),
+    CombineField('forty_time', ('40yard', '40yd'), 'sec', 'float'),
+    CombineField('twenty_time', ('20yard', '20yd'), 'sec', 'float'),
+    CombineField('ten_time', ('10yard', '10yd'), 'sec', 'float'),
+    CombineField('bench', ('benchpress', 'bench'), 'reps', 'int'),
+    CombineField('vertical', ('verticalleap', 'vertical'), '"', 'float'),
+    CombineField('broad_jump', ('broadjump', 'broad'), '"', 'float'),
+    CombineField('shuttle', ('20ydshuttle', '20yardshuttle', 'shortshuttle', 'shuttle'), 'sec', 'float'),
+    CombineField('three_cone', ('threecone', '3cone'), 'sec', 'float'),
+    CombineField('sixty_shuttle', ('60ydshuttle', '60yardshuttle'), 'sec', 'float'),
+]
+
+# 見出しの行など、値を持たない行の見出し
+ignored_labels = {'', 'drill'}
+
+# 全ての項目の単位をまとめて取り除く正規表現
+_unit_pattern = '|'.join(sorted({re.escape(field.unit) for field in combine_fields}, key=len, reverse=True))
+
+_fields_by_label = {label: field for field in combine_fields for label in field.labels}
+# 前方一致で探すときは長い候補を先に試す。('20yard'より'20yardshuttle'を優先する)
+_prefix_labels = sorted(_fields_by_label, key=len, reverse=True)
+
+
+def normalize_label(label):
+    return ''.join(ch for ch in label.lower() if ch.isalnum())
+
+
+def match_field(label):
+    """
+        見出しに対応するCombineFieldを返す。見つからなければNone。
+    """
+    label = normalize_label(label)
+    field = _fields_by_label.get(label)
+    if field is not None:
+        return field
+    for candidate in _prefix_labels:
+        if label.startswith(candidate):
+            return _fields_by_label[candidate]
+    return None
+
+
+def raw_values(rows):
+    """
+        parameters:
+            rows: page_parser.parse_combine_page() の返り値
+        returns:
+            PlayerRecordの属性名 → 値の文字列 のdict。ページにない項目は含まれない。
+    """
+    values = dict()
+    for cells in rows or []:
+        if len(cells) < 2:
+            continue
+        field = match_field(cells[0])
+        if field is None:
+            if normalize_label(cells[0]) not in ignored_labels:
+                metrics.inc('combine_unknown_labels_total', label=cells[0].strip())
+            continue
+        # 同じ項目が2回出てきた場合は最初の行を使う。
+        values.setdefault(field.attribute, cells[1])
+    return values
+
+
+def convert_values(raw_rows):
+    """
+        parameters:
+            raw_rows: raw_values() の返り値の配列(選手ごと)
+        returns:
+            選手ごとに PlayerRecordの属性名 → 数値(なければNone) のdictの配列
+
+        全選手・全項目の値の文字列を1つのSeriesにまとめ、単位を取り除いて一度に数値に変換する。
+    """
+    import numpy as np
+    import pandas as pd
+
+    raw_rows = list(raw_rows)
+    attributes = [field.attribute for field in combine_fields]
+    flat = pd.Series([row.get(attribute) for row in raw_rows for attribute in attributes], dtype='string')
+    # '(N/A)'など数値でないものは欠損値になる。
+    values = pd.to_numeric(flat.str.replace(_unit_pattern, '', regex=True).str.strip(),
+                           errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+    values = values.reshape(len(raw_rows), len(attributes))
+
+    converted = list()
+    for player_values in values.tolist():
+        # 欠損値はNoneにして、それ以外はPythonのint/floatにする。
+        converted.append({field.attribute: None if value != value else (round(value) if field.dtype == 'int' else value)
+                          for field, value in zip(combine_fields, player_values)})
+    return converted
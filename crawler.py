@@ -19,52 +19,93 @@
 """
 
 # Imports
-import requests
-from bs4 import BeautifulSoup as bs
+# bs4、pandas、tqdmは重いので、使う関数の中でimportする。
+import argparse
 import os
-import time
-import pandas as pd
-from tqdm import tqdm
+import asyncio
+import requests
+from fetcher import Fetcher
+import http_session
+import metrics
+from metrics import metrics as run_metrics
+from manifest import CrawlManifest, STATUS_DONE, STATUS_NOT_FOUND, STATUS_FAILED
+from player_resolver import PlayerResolver
+from page_store import get_store, KIND_COMBINE, KIND_STATS
+from player_identity import player_key
+import work_queue
 
 # url_list
-combine_index_url = "https://nflcombineresults.com/nflcombinedata.php?year=2020&pos=WR&college="
-draft_table_url = "https://www.pro-football-reference.com/play-index/draft-finder.cgi?request=1&year_min=1987&year_max=2020&pick_type=overall&pos%5B%5D=wr&conference=any&show=all&order_by=default"
+# 全ポジション・全年のcrawlでは、シャードごとに{year}と{pos}を埋めて使う。
+combine_index_url_template = "https://nflcombineresults.com/nflcombinedata.php?year={year}&pos={pos}&college="
+draft_table_url_template = "https://www.pro-football-reference.com/play-index/draft-finder.cgi?request=1&year_min={year_min}&year_max={year_max}&pick_type=overall&pos%5B%5D={pos}&conference=any&show=all&order_by=default"
+combine_index_url = combine_index_url_template.format(year=2020, pos='WR')
+college_stats_base_url = "https://www.sports-reference.com/cfb/players/"
+draft_table_url = draft_table_url_template.format(
+    year_min=1987, year_max=2020, pos='wr')
 
 
 # directory paths
-output_directory_path_for_combine = './crawl_exports/combine_results'
-output_directory_path_for_stats = './crawl_exports/college_stats'
+# combine結果と大学時代の戦績のページは page_store.store_path のページストアに保存される。
 output_directory_path = './crawl_exports'
+# シャードごとのドラフトページと選手一覧
+output_directory_path_for_shards = './crawl_exports/shards'
+name_year_file_name = 'player_name_draft_year_colleges.csv'
+
+
+def fetch_page(url, rates=None):
+    """
+        1ページだけをfetcher.Fetcherでfetchする同期版。
+        詳細ページと同じく、429/5xxはRetry-Afterやバックオフを待ってリトライし、それでも失敗すればrequests.HTTPErrorを投げる。
+    """
+
+    async def run():
+        async with Fetcher(1, rates) as fetcher:
+            return await fetcher.fetch(url)
 
+    page = asyncio.run(run())
+    page.raise_for_status()
+    return page
 
-def draft_page_crawler():
+
+def draft_page_crawler(url=draft_table_url, file_path=None, rates=None):
     """
         2020,2019年にドラフトされた選手は、大学時代の戦績が乗ったページにドラフトされた順位が載っていないため、別途ここでクロールしたページを使う。
+        parameters:
+            url: ドラフト検索ページのURL
+            file_path: 出力先。Noneの場合は"crawl_exports/draft_page.html"
+            rates: fetcher.Fetcherにそのまま渡される
     """
 
-    draft_page = requests.get(draft_table_url)
-    file_name = "draft_page.html"
+    # 429や5xxのページをドラフトページとして保存しないようにする。
+    draft_page = fetch_page(url, rates)
+    if file_path is None:
+        file_path = os.path.join(output_directory_path, "draft_page.html")
 
-    if not os.path.exists(output_directory_path):
-        os.mkdir(output_directory_path)
-    with open(os.path.join(output_directory_path, file_name), 'w') as f:
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, 'w') as f:
         f.write(draft_page.text.encode('ascii', 'ignore').decode('utf-8'))
 
 
-def get_show_urls_and_draft_year(index_url):
+def get_show_urls_and_draft_year(index_url, file_path=None, position=None, rates=None):
     """
         parameters:
             index_url: 詳細ページのURLを含んだ一覧ページのURL
+            file_path: 選手一覧のcsvの出力先。Noneの場合は"crawl_exports/player_name_draft_year_colleges.csv"
+            position: 渡された場合はcsvにPosition列を加える
+            rates: fetcher.Fetcherにそのまま渡される
         returns:
             <list>url_list, <list>player_names, <list>draft_year, <list>colleges
 
-        詳細画面のURLの配列、選手名の配列、ドラフト年の配列が返される
+        詳細画面のURLの配列、選手名の配列、ドラフト年の配列、大学名の配列が返される
         scraperで使うために、選手名、ドラフト年、大学名が入ったcsvファイルが出力される。
         デバッグ目的で引数として一覧ページのURLを渡すようにしている。
     """
 
+    import pandas as pd
+    from bs4 import BeautifulSoup as bs
+
     # responseとsoupの準備
-    combine_index_response = requests.get(index_url)
+    combine_index_response = fetch_page(index_url, rates)
     combine_index_soup = bs(combine_index_response.text, 'html.parser')
 
     # 詳細ページのURLを配列い保存する
@@ -87,129 +128,380 @@ def get_show_urls_and_draft_year(index_url):
     # Scraperで使うために選手名とドラフト年が入ったデータフレームをcsvファイルにエクスポート
     name_year_dict = {'Player_Name': player_name_list,
                       'Draft_Year': draft_years, 'College': colleges}
+    if position is not None:
+        name_year_dict['Position'] = [position] * len(player_name_list)
     name_year_df = pd.DataFrame(name_year_dict)
-    if not os.path.exists(output_directory_path):
-        os.mkdir(output_directory_path)
-    file_name = os.path.join(
-        output_directory_path, 'player_name_draft_year_colleges.csv')
-    name_year_df.to_csv(file_name, index=False)
+    if file_path is None:
+        file_path = os.path.join(output_directory_path, name_year_file_name)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    name_year_df.to_csv(file_path, index=False)
 
-    return combine_show_urls, player_name_list, draft_years
+    return combine_show_urls, player_name_list, draft_years, colleges
 
 
-def crawl_show_pages(url_list, player_name_list, draft_years):
+async def crawl_show_page_async(fetcher, url, name, draft_year, college, manifest=None, store=None):
+    """
+        1人分のCombineの結果詳細ページをcrawlし、ページストアに kind='combine'、キーは player_identity.player_key() で保存する。
+        保存できた(またはすでに保存済みの)場合はTrueを返す。
+    """
+
+    store = store or get_store()
+    key = player_key(name, draft_year, college)
+    manifest_key = '{}:{}'.format(KIND_COMBINE, key)
+    if manifest is not None and manifest.is_fresh(manifest_key, exists=lambda _: store.has(KIND_COMBINE, key)):
+        return True
+
+    # scrapeをし、ページストアに保存
+    try:
+        combine_show_response = await fetcher.fetch(url)
+    except requests.RequestException:
+        combine_show_response = None
+    if combine_show_response is None or combine_show_response.status_code != 200:
+        # 失敗したページは保存せず、次のrunで再度crawlする。
+        if manifest is not None:
+            manifest.record(manifest_key, url, STATUS_FAILED)
+        return False
+
+    store.put(KIND_COMBINE, key, combine_show_response.text, url)
+    if manifest is not None:
+        manifest.record(manifest_key, url, STATUS_DONE,
+                        combine_show_response.text)
+    return True
+
+
+async def crawl_show_pages_async(fetcher, url_list, player_name_list, draft_years, colleges, manifest=None, store=None):
     """
         parameters:
+            fetcher: fetcher.Fetcher
             url_list: crawlしたいページのURLの配列
-            player_name_list: ファイル名作成用の選手名一覧
+            player_name_list: ページストアのキー作成用の選手名一覧
+            colleges: ページストアのキー作成用の大学名一覧
+            manifest: manifest.CrawlManifest。渡された場合は保存済みでまだ新しいページを飛ばす。
+            store: page_store.PageStore。Noneの場合はデフォルトのページストアを使う。
+
+        与えられたURLSのページを並列にcrawlingする。
+        crawlしたものはページストアに kind='combine'、キーは player_identity.player_key() で保存される。
+        リクエストの間隔はfetcherのホストごとのレート制限で調整される。
+    """
 
-        与えられたURLSのページをcrawlingする。
-        crawlしたものは"{first_name}_{last_name}_{ドラフト年}"というファイル名で出力される。
+    async def crawl_one(url, name, draft_year, college, pbar):
+        await crawl_show_page_async(fetcher, url, name, draft_year, college, manifest, store)
+        pbar.update(1)
 
-    """
+    from tqdm import tqdm
 
-    # ユーザーへ有益な出力をするためにenumerateしてます。
+    # コードが正常に動いていることをユーザーに知らせるアウトプット
     with tqdm(total=len(url_list)) as pbar:
-        for url, name, draft_year in zip(url_list, player_name_list, draft_years):
-            splitted_name = name.split()
-            first_name = splitted_name[0]
-            last_name = splitted_name[1]
+        await asyncio.gather(*[crawl_one(url, name, draft_year, college, pbar)
+                               for url, name, draft_year, college in zip(url_list, player_name_list, draft_years, colleges)])
+
 
-            # 出力用のファイル名の作成・保存先フォルダの作成
-            file_name = "{}_{}_{}.html".format(
-                first_name, last_name, draft_year)
-            os.makedirs(output_directory_path_for_combine, exist_ok=True)
+def crawl_show_pages(url_list, player_name_list, draft_years, colleges, max_workers=None, rates=None):
+    """
+        parameters:
+            url_list: crawlしたいページのURLの配列
+            player_name_list: ページストアのキー作成用の選手名一覧
+            colleges: ページストアのキー作成用の大学名一覧
+            max_workers, rates: fetcher.Fetcherにそのまま渡される
+
+        crawl_show_pages_asyncの同期版。
+    """
 
-            # scrapeをし、ファイルに出力
-            combine_show_response = requests.get(url)
-            with open(os.path.join(output_directory_path_for_combine, file_name), mode='w', encoding='utf-8') as f:
-                f.write(combine_show_response.text)
+    async def run():
+        async with Fetcher(max_workers, rates) as fetcher:
+            await crawl_show_pages_async(fetcher, url_list, player_name_list, draft_years, colleges)
 
-                # サーバーに負荷をかけすぎないために処理の一時停止・コードが正常に動いていることをユーザーに知らせるアウトプット
-                pbar.update(1)
-                time.sleep(1)
+    asyncio.run(run())
 
 
-def crawl_college_stats_pages(name, draft_year):
+async def crawl_college_stats_pages_async(fetcher, name, draft_year, manifest=None, resolver=None, college=None, store=None):
     """
         引数として渡される名前とドラフト年を用いて、大学時代の戦績をcrawlする。
-        出力ファイル名は"{first_name}_{last_name}_{draft_year}.html"
+        ページストアに kind='stats'、キーは player_identity.player_key() で保存される。
         parameters:
+            fetcher: fetcher.Fetcher
             name: 選手名
             draft_year: ドラフト年
+            manifest: manifest.CrawlManifest。渡された場合は保存済みでまだ新しいページを飛ばす。
+            resolver: player_resolver.PlayerResolver。Noneの場合はこの選手だけのために作る。
+            college: 大学名。同じ年に同姓同名の選手がいた場合の判別と、ページストアのキーに使う。
+            store: page_store.PageStore。Noneの場合はデフォルトのページストアを使う。
     """
 
-    # 選手名の下処理
-    splitted_name = name.split()
-    first_name = splitted_name[0].lower()
-    last_name = splitted_name[1].lower()
+    store = store or get_store()
+    key = player_key(name, draft_year, college)
+    manifest_key = '{}:{}'.format(KIND_STATS, key)
+    if manifest is not None and manifest.is_fresh(manifest_key, exists=lambda _: store.has(KIND_STATS, key)):
+        return int(manifest.status(manifest_key) == STATUS_NOT_FOUND)
+
+    if resolver is None:
+        resolver = PlayerResolver(fetcher, college_stats_base_url, path=None)
+
+    # 同姓同名の選手の中から、ドラフト年-1の年が最後のシーズンになっているページを探す。
+    url = None
+    try:
+        url, page = await resolver.resolve(name, draft_year, college)
+        # インデックスのキャッシュから解決した場合は、そのページだけをfetchする。
+        if url is not None and page is None:
+            page = await fetcher.fetch(url)
+            # インデックスの候補が消えていれば、インデックスから捨てて1回だけ調べ直す。
+            if page.status_code == 404:
+                resolver.forget(name)
+                url, page = await resolver.resolve(name, draft_year, college)
+                if url is not None and page is None:
+                    page = await fetcher.fetch(url)
+        if page is not None:
+            page.raise_for_status()
+    except requests.RequestException:
+        if manifest is not None:
+            manifest.record(manifest_key, url, STATUS_FAILED)
+        return 0
+
+    # ページが見つからなければ、"stats not found"と記載されたページを保存
+    if url is None:
+        store.put(KIND_STATS, key, "Stats not found")
+        if manifest is not None:
+            manifest.record(manifest_key, None, STATUS_NOT_FOUND)
+        return 1
+
+    store.put(KIND_STATS, key, page.text, url)
+    if manifest is not None:
+        manifest.record(manifest_key, url, STATUS_DONE, page.text)
+    return 0
+
+
+def crawl_college_stats_pages(name, draft_year, college=None, max_workers=None, rates=None):
+    """
+        crawl_college_stats_pages_asyncの同期版。
+    """
 
-    # 大学時代の戦績・ドラフト情報が乗ったページのベースURL
-    base_url = "https://www.sports-reference.com/cfb/players/"
+    async def run():
+        async with Fetcher(max_workers, rates) as fetcher:
+            return await crawl_college_stats_pages_async(fetcher, name, draft_year, college=college)
 
-    # 同姓同名のチェック
-    same_name_counter = 1
-    stats_not_found_counter = 0
-    # urlのフォーマット、"{first_name}-{last_name}-{same_name_counter}"は、同姓同名の選手を最後のsame_name_counterで識別する。
-    while True:
-        time.sleep(1)
-        url = base_url + \
-            "{}-{}-{}.html".format(first_name, last_name, same_name_counter)
-        print(url)
-        page = requests.get(url)
-        temp_soup = bs(page.text, 'html.parser')
-        if temp_soup.select_one('tbody') is not None:
-            page_year = temp_soup.select_one('tbody').select(
-                'tr')[-1].select_one('th').get_text()
-            page_year = ''.join([num for num in page_year if num.isdecimal()])
-        else:
-            page_year = 0
-
-        # getしたものに"404 error"という文言が入っていれば、ページが存在しなかったとのことなので、"stats not found"と記載されたhtmlを出力
-        if "404 error" in page.text:
-            file_name = "{}-{}-{}-stats.html".format(
-                first_name, last_name, draft_year)
-            os.makedirs(output_directory_path_for_stats, exist_ok=True)
-            with open(os.path.join(output_directory_path_for_stats, file_name), mode='w') as f:
-                f.write("Stats not found")
-            stats_not_found_counter = 1
-            break
-
-        # getしたものにドラフト年-1の年（求める人であれば戦績のテーブルに必ず入っている）が入っているかどうかを確認。
-        # ドラフト年-1の年がテキストの中に入ってなければ、same_name_counterを更新してループの最初に戻る。
-        elif str(int(draft_year)-1) != page_year:
-            same_name_counter = same_name_counter + 1
-            continue
+    return asyncio.run(run())
 
-        # 上記のif文を全てクリアすれば求める人の戦績が載っているpageであることがわかったので、ファイルに出力
-        else:
-            file_name = "{}-{}-{}-stats.html".format(
-                first_name, last_name, draft_year)
-            os.makedirs(output_directory_path_for_stats, exist_ok=True)
-            with open(os.path.join(output_directory_path_for_stats, file_name), mode='w', encoding='utf-8') as f:
-                f.write(page.text)
-            break
-    return stats_not_found_counter
 
+async def crawl_all_stats_pages_async(fetcher, player_name_list, draft_years, colleges, manifest=None, resolver=None, store=None):
+    """
+        全選手の大学時代の戦績を並列にcrawlし、戦績が見つからなかった選手の数を返す。
+    """
 
-def main():
-    draft_page_crawler()
+    async def crawl_one(name, draft_year, college, pbar):
+        stats_not_found_counter = await crawl_college_stats_pages_async(fetcher, name, draft_year, manifest, resolver, college, store)
+        pbar.update(1)
+        return stats_not_found_counter
 
-    print('Crawling combine results: ')
-    test_urls, player_name_list, draft_years = get_show_urls_and_draft_year(
-        combine_index_url)
+    from tqdm import tqdm
 
-    crawl_show_pages(test_urls, player_name_list, draft_years)
-    stats_not_found_counter = list()
-    print("Crawling stats:")
     with tqdm(total=len(player_name_list)) as pbar:
-        for name, draft_year in zip(player_name_list, draft_years):
-            stats_not_found_counter.append(
-                crawl_college_stats_pages(name, draft_year))
-            pbar.update(1)
+        stats_not_found_counter = await asyncio.gather(*[crawl_one(name, draft_year, college, pbar)
+                                                         for name, draft_year, college in zip(player_name_list, draft_years, colleges)])
+    return sum(stats_not_found_counter)
+
+
+async def crawl_detail_pages(url_list, player_name_list, draft_years, colleges, max_workers=None, rates=None, manifest=None, store=None):
+    """
+        Combineの詳細ページと大学時代の戦績ページを同時にcrawlし、ページストアに保存する。
+        ホストが違うので、それぞれのホストのレート制限の範囲で並行して進む。
+        同姓同名の選手ページのインデックスは player_resolver.index_path に保存され、次のrunで使われる。
+    """
+    async with Fetcher(max_workers, rates) as fetcher:
+        resolver = PlayerResolver(fetcher, college_stats_base_url)
+        try:
+            _, stats_not_found = await asyncio.gather(
+                crawl_show_pages_async(
+                    fetcher, url_list, player_name_list, draft_years, colleges, manifest, store),
+                crawl_all_stats_pages_async(fetcher, player_name_list, draft_years, colleges, manifest, resolver, store))
+        finally:
+            resolver.save()
+    return stats_not_found
+
+
+def filter_since(since, url_list, player_name_list, draft_years, colleges):
+    """
+        ドラフト年がsince以降の選手だけを残す。
+    """
+    rows = [row for row in zip(url_list, player_name_list, draft_years, colleges)
+            if int(row[2]) >= since]
+    return [list(column) for column in zip(*rows)] if rows else [[], [], [], []]
+
+
+def crawl_shard(year, pos, max_workers=None, manifest=None, queue=None):
+    """
+        1つのシャード(ドラフト年とポジション)のドラフトページ、選手一覧、詳細ページをcrawlする。
+        ドラフトページと選手一覧は"crawl_exports/shards/{year}_{pos}"に保存される。
+        queueを渡すと、crawlの間 lease_seconds の1/3ごとにシャードの期限を延ばす。
+        他のプロセスに取り直されていたら、crawlをやめてRuntimeErrorを投げる。
+    """
+
+    def renew():
+        if queue is not None and not queue.renew(year, pos):
+            raise RuntimeError('lost the lease on shard {} {}'.format(year, pos))
+
+    async def crawl_with_heartbeat():
+        task = asyncio.create_task(crawl_detail_pages(
+            url_list, player_name_list, draft_years, colleges, max_workers, manifest=manifest))
+        try:
+            while True:
+                done, _ = await asyncio.wait({task}, timeout=None if queue is None else queue.lease_seconds / 3)
+                if done:
+                    return task.result()
+                renew()
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    shard_name = '{}_{}'.format(year, pos)
+    draft_page_crawler(draft_table_url_template.format(year_min=year, year_max=year, pos=work_queue.positions[pos]),
+                       os.path.join(output_directory_path_for_shards, shard_name + '_draft_page.html'))
+    url_list, player_name_list, draft_years, colleges = get_show_urls_and_draft_year(
+        combine_index_url_template.format(year=year, pos=pos),
+        os.path.join(output_directory_path_for_shards, shard_name + '.csv'), pos)
+    renew()
+    return asyncio.run(crawl_with_heartbeat())
+
+
+def merge_shard_lists(queue):
+    """
+        処理が終わったシャードの選手一覧を1つにまとめ、scraperが読む"player_name_draft_year_colleges.csv"に書き出す。
+    """
+    import pandas as pd
+
+    frames = list()
+    for year, pos in queue.done_shards():
+        file_path = os.path.join(
+            output_directory_path_for_shards, '{}_{}.csv'.format(year, pos))
+        if os.path.exists(file_path):
+            frames.append(pd.read_csv(file_path))
+    if not frames:
+        return 0
+    name_year_df = pd.concat(frames, ignore_index=True)
+    name_year_df.to_csv(os.path.join(
+        output_directory_path, name_year_file_name), index=False)
+    return len(name_year_df)
+
+
+def run_worker(queue, max_workers=None, manifest=None):
+    """
+        キューが空になるまでシャードを取ってcrawlする。
+        複数のプロセスやマシンで同時に実行しても、同じシャードを重複してcrawlすることはない。
+        (crawlの間はシャードの期限を延ばし続け、他のプロセスに取り直されたらそのシャードはやめる)
+    """
+    while True:
+        shard = queue.claim()
+        if shard is None:
+            break
+        year, pos = shard
+        print('Crawling shard {} {}: '.format(year, pos))
+        try:
+            crawl_shard(year, pos, max_workers, manifest, queue)
+        except Exception as e:
+            print('shard {} {} failed: {}'.format(year, pos, e))
+            queue.fail(year, pos)
+        else:
+            if not queue.complete(year, pos):
+                print('shard {} {} was claimed by another worker'.format(year, pos))
+    print('Merged {} players from finished shards'.format(
+        merge_shard_lists(queue)))
+    print(queue.status_counts())
 
-    print("Number of stats not found: ".format(sum(stats_not_found_counter)))
+
+def parse_years(text):
+    """
+        "1987-2020"や"2020"を年の配列にする。
+    """
+    if '-' in text:
+        start, end = text.split('-')
+        return list(range(int(start), int(end) + 1))
+    return [int(text)]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Crawl NFL combine results and college stats.')
+    parser.add_argument('--since', type=int, default=None,
+                        help='only crawl players drafted in this year or later (with --plan, only queue those years)')
+    parser.add_argument('--max-age-days', type=float, default=None,
+                        help='recrawl pages fetched more than this many days ago')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='maximum number of concurrent requests')
+    parser.add_argument('--plan', metavar='YEARS', default=None,
+                        help='queue (year, position) shards for these draft years, e.g. 1987-2020')
+    parser.add_argument('--positions', default=None,
+                        help='comma separated combine positions to plan (default: all)')
+    parser.add_argument('--worker', action='store_true',
+                        help='claim shards from the work queue and crawl them until it is empty')
+    parser.add_argument('--queue', default=work_queue.queue_path,
+                        help='path of the shared work queue')
+    http_session.add_arguments(parser)
+    metrics.add_arguments(parser)
+    args = parser.parse_args(argv)
+    # キューのシャードは年ごとなので、--sinceは--planで積む年に効かせる。
+    if args.since is not None and args.worker and args.plan is None:
+        parser.error('--since only applies to --plan in work queue mode')
+    return args
+
+
+def crawl(args):
+    """
+        コマンドラインの引数に従ってcrawlする。
+    """
+    if args.plan is not None or args.worker:
+        queue = work_queue.WorkQueue(args.queue)
+        try:
+            if args.plan is not None:
+                shard_positions = args.positions.split(
+                    ',') if args.positions else None
+                years = parse_years(args.plan)
+                if args.since is not None:
+                    years = [year for year in years if year >= args.since]
+                print('Queued {} shards'.format(queue.plan(years, shard_positions)))
+            if args.worker:
+                manifest = CrawlManifest(max_age_days=args.max_age_days)
+                try:
+                    with run_metrics.span('worker'):
+                        run_worker(queue, args.workers, manifest)
+                finally:
+                    manifest.close()
+        finally:
+            queue.close()
+        return
+
+    with run_metrics.span('draft_page'):
+        draft_page_crawler()
+
+    print('Crawling combine results and stats: ')
+    with run_metrics.span('index'):
+        test_urls, player_name_list, draft_years, colleges = get_show_urls_and_draft_year(
+            combine_index_url)
+    if args.since is not None:
+        test_urls, player_name_list, draft_years, colleges = filter_since(
+            args.since, test_urls, player_name_list, draft_years, colleges)
+
+    # 保存済みのページはマニフェストを見て飛ばす。
+    manifest = CrawlManifest(max_age_days=args.max_age_days)
+    try:
+        with run_metrics.span('detail_pages'):
+            stats_not_found = asyncio.run(crawl_detail_pages(
+                test_urls, player_name_list, draft_years, colleges, args.workers, manifest=manifest))
+    finally:
+        manifest.close()
+
+    print("Number of stats not found: {}".format(stats_not_found))
     print("done")
 
 
-main()
+def main(argv=None):
+    args = parse_args(argv)
+    metrics.configure(args.profile_dir)
+    http_session.configure(args.record, args.replay)
+    try:
+        crawl(args)
+    finally:
+        if args.metrics is not None:
+            run_metrics.write_report(args.metrics)
+
+
+if __name__ == '__main__':
+    main()
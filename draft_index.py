@@ -0,0 +1,245 @@
+"""
+-----------------------------------------------------------------------
+-- ドラフト指名のインデックス ---------------------------------------------
+-----------------------------------------------------------------------
+
+    pro-football-referenceのドラフト検索ページ(crawlerが保存したdraft_page.html)から、
+    全てのドラフト年の指名を一度だけ読み込み、(正規化した選手名, ドラフト年, 正規化した大学名) → ドラフト巡 のdictにする。
+    scraperは選手ごとにこのdictを引くだけでドラフト巡がわかる。
+    作ったインデックスはSQLiteに保存し、ドラフトページが更新されるまでは使い回す。
+    保存は1つのトランザクションで全ての指名を入れ替えるので、複数のプロセスが同時に作り直しても壊れたインデックスは読まれない。
+
+    選手名と大学名は player_identity で正規化する。'.' やJr、IIIなどの接尾辞を除くので、サイトごとの表記の違いを吸収できる。
+
+        python draft_index.py  (または python -m nflcombine draft-index)
+    でインデックスを作り直せる。
+
+-----------------------------------------------------------------------
+-----------------------------------------------------------------------
+
+
+"""
+
+# Imports
+import argparse
+import glob
+import os
+import re
+import sqlite3
+import time
+
+from player_identity import normalize_name, normalize_college
+
+index_path = './crawl_exports/draft_index.sqlite3'
+# crawlerが保存するドラフトページ。シャードごとのページも全て読む。
+draft_page_paths = ['./crawl_exports/draft_page.html',
+                    './crawl_exports/shards/*_draft_page.html']
+
+meta_draft_pattern = re.compile(
+    r'Draft:?\s*(?:</strong>)?\s*:?\s*[^0-9<]*?(\d+)(?:st|nd|rd|th) round')
+
+
+def _cell(row, data_stat, position):
+    """
+        data-stat属性で列を探し、なければ何番目の'td'かで探す。
+    """
+    cells = row.xpath("./td[@data-stat='{}']".format(data_stat))
+    if cells:
+        return cells[0]
+    if position is None:
+        return None
+    tds = row.xpath('./td')
+    return tds[position] if len(tds) > position else None
+
+
+def read_draft_page(content):
+    """
+        ドラフト検索ページから (選手名, ドラフト年, 大学名, ドラフト巡) の配列を返す。
+        大学名の列がないページでは大学名はNoneになる。
+    """
+    import lxml.html
+
+    tree = lxml.html.fromstring(content)
+    picks = list()
+    for row in tree.xpath("//table[@id='results']/tbody/tr"):
+        # classが指定されている行はデータを含まない見出しの行なので飛ばす。
+        if row.get('class'):
+            continue
+        # 1つ目のtdにドラフト年、2つ目にドラフト巡、4つ目に名前が入っている。
+        year, draft_round, player = _cell(row, 'year_id', 0), _cell(
+            row, 'draft_round', 1), _cell(row, 'player', 3)
+        if year is None or draft_round is None or player is None:
+            continue
+        college = _cell(row, 'college_id', None)
+        try:
+            picks.append((player.text_content().strip(), int(year.text_content()),
+                          None if college is None else college.text_content().strip(),
+                          int(draft_round.text_content())))
+        except ValueError:
+            continue
+    return picks
+
+
+class DraftIndex:
+    """
+        parameters:
+            picks: (選手名, ドラフト年, 大学名, ドラフト巡) の配列
+
+        lookup()はdictを引くだけなので、選手数によらずO(1)。
+    """
+
+    def __init__(self, picks):
+        self.picks = list(picks)
+        self.by_college = dict()
+        # 大学名がわからない場合のために (選手名, ドラフト年) でも引けるようにする。
+        # 同じ年に同姓同名の選手が指名されていた場合は区別できないのでNoneにしておく。
+        self.by_name = dict()
+        self.years = set()
+        for name, year, college, draft_round in self.picks:
+            name = normalize_name(name)
+            self.years.add(year)
+            if college is not None:
+                self.by_college[(name, year, normalize_college(college))] = draft_round
+            key = (name, year)
+            self.by_name[key] = draft_round if key not in self.by_name else None
+
+    def lookup(self, name, year, college=None):
+        """
+            ドラフト巡を返す。指名されていなければ0。
+        """
+        name, year = normalize_name(name), int(year)
+        draft_round = self.by_college.get(
+            (name, year, normalize_college(college)))
+        if draft_round is None:
+            draft_round = self.by_name.get((name, year))
+        return draft_round or 0
+
+    def save(self, path=index_path):
+        """
+            全ての指名を1つのトランザクションで入れ替え、作った時刻を記録する。
+        """
+        conn = _connect(path)
+        try:
+            with conn:
+                conn.execute('DELETE FROM picks')
+                conn.executemany('INSERT INTO picks (name, year, college, draft_round) VALUES (?, ?, ?, ?)',
+                                 self.picks)
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('built_at', ?)", (time.time(),))
+        finally:
+            conn.close()
+
+    @classmethod
+    def load(cls, path=index_path):
+        if not os.path.exists(path):
+            raise FileNotFoundError('no draft index at {}'.format(path))
+        conn = _connect(path)
+        try:
+            return cls(conn.execute('SELECT name, year, college, draft_round FROM picks ORDER BY rowid').fetchall())
+        finally:
+            conn.close()
+
+
+def _connect(path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=60)
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS picks (
+            name TEXT NOT NULL,
+            year INTEGER NOT NULL,
+            college TEXT,
+            draft_round INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value REAL
+        );
+    """)
+    return conn
+
+
+def built_at(path=index_path):
+    """
+        インデックスを作った時刻。まだ作っていなければNone。
+    """
+    if not os.path.exists(path):
+        return None
+    conn = _connect(path)
+    try:
+        row = conn.execute("SELECT value FROM meta WHERE key = 'built_at'").fetchone()
+    finally:
+        conn.close()
+    return None if row is None else row[0]
+
+
+def find_draft_pages(patterns=None):
+    paths = list()
+    for pattern in patterns or draft_page_paths:
+        paths.extend(sorted(glob.glob(pattern)))
+    return paths
+
+
+def build_draft_index(page_paths=None):
+    """
+        ドラフトページを全て読み込んでDraftIndexを作る。
+    """
+    picks = list()
+    for page_path in page_paths or find_draft_pages():
+        with open(page_path, 'r') as f:
+            picks.extend(read_draft_page(f.read()))
+    # 複数のページに同じ指名が載っていることがあるので、重複を除く。
+    return DraftIndex(sorted(set(picks), key=lambda pick: (pick[1], pick[3], pick[0])))
+
+
+def load_or_build_draft_index(path=index_path, page_paths=None):
+    """
+        保存されたインデックスがドラフトページより新しければそれを読み込み、古ければ作り直して保存する。
+    """
+    page_paths = page_paths or find_draft_pages()
+    newest_page = max([os.path.getmtime(page_path)
+                       for page_path in page_paths], default=0)
+    built = built_at(path)
+    if built is not None and built >= newest_page:
+        return DraftIndex.load(path)
+    draft_index = build_draft_index(page_paths)
+    draft_index.save(path)
+    return draft_index
+
+
+_process_index = None
+
+
+def get_draft_index(path=index_path):
+    """
+        プロセスごとに1回だけインデックスを読み込んで返す。scraperのワーカープロセスから使う。
+    """
+    global _process_index
+    if _process_index is None or _process_index[0] != path:
+        _process_index = (path, DraftIndex.load(path))
+    return _process_index[1]
+
+
+def round_from_meta(meta):
+    """
+        インデックスで見つからなかった選手のために、戦績ページの#metaからドラフト巡を読む。
+        見つからなければ0。
+    """
+    match = meta_draft_pattern.search(str(meta))
+    return int(match.group(1)) if match else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Rebuild the draft pick index from the crawled draft pages.')
+    parser.add_argument('--path', default=index_path,
+                        help='where to save the index')
+    args = parser.parse_args(argv)
+
+    built_index = build_draft_index()
+    built_index.save(args.path)
+    print('indexed {} picks from {} draft years'.format(
+        len(built_index.picks), len(built_index.years)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+"""
+-----------------------------------------------------------------------
+-- 並列fetchエンジン ---------------------------------------------------
+-----------------------------------------------------------------------
+
+    asyncioを使って複数のページを同時にfetchする。
+        - ワーカー数(同時に処理するリクエスト数)は max_workers で上限を決める。
+        - ホストごとにトークンバケットを持たせ、ホストごとのペースでリクエストを送る。
+          nflcombineresults.com と sports-reference.com はそれぞれのペースで同時にcrawlされる。
+        - ホストごとのペースと同時リクエスト数はAIMDで調整する。
+            成功が続いている間は少しずつ上げ(加算)、429や5xxが返ってきたら半分に下げる(乗算)。
+        - 429/5xxや接続エラーはリトライする。Retry-Afterがあればその間そのホストへのリクエストを止め、
+          なければジッター付きの指数バックオフで待つ。
+    リクエストはhttp_sessionの共有セッションを通し、スレッドプール上で実行する。
+
+-----------------------------------------------------------------------
+-----------------------------------------------------------------------
+
+
+"""
+
+# Imports
+import asyncio
+import email.utils
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from urllib.parse import urlsplit
+
+import requests
+
+from http_session import get_session
+from metrics import metrics
+
+# ホストごとの1秒あたりのリクエスト数。ここにないホストは default_rate が使われる。
+host_rates = {
+    'nflcombineresults.com': 1.0,
+    'www.sports-reference.com': 1.0,
+    'www.pro-football-reference.com': 1.0,
+}
+default_rate = 1.0
+default_max_workers = 8
+# サーバーが落ち着いている間に、最初のペースの何倍まで上げてよいか
+rate_headroom = 3.0
+# 成功1回ごとに上げるペース(最初のペースに対する割合)
+rate_increase = 0.05
+min_rate = 0.05
+
+# リトライするステータスコード
+retry_statuses = {429, 500, 502, 503, 504}
+max_retries = 5
+backoff_base = 1.0
+backoff_max = 60.0
+request_timeout = 30
+
+
+def parse_retry_after(value):
+    """
+        Retry-Afterヘッダー(秒数かHTTPの日付)を待つ秒数にする。読めなければNone。
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+def backoff_delay(attempt):
+    """
+        attempt回目のリトライの前に待つ秒数。上限付きの指数バックオフにフルジッターをかける。
+    """
+    return random.uniform(0, min(backoff_max, backoff_base * 2 ** attempt))
+
+
+class TokenBucket:
+    """
+        parameters:
+            rate: 1秒あたりに補充されるトークン数
+            capacity: バケットに貯められるトークンの最大数(バースト数)
+
+        acquire()はトークンが1つ貯まるまで待ってから、トークンを1つ消費する。
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds):
+        """
+            Retry-Afterの間、このバケットからトークンを出さない。
+        """
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens +
+                          (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self):
+        # 同じホストへのリクエストが同時にトークンを取り合わないようにロックをかける。
+        async with self._lock:
+            paused = self.paused_until - time.monotonic()
+            if paused > 0:
+                await asyncio.sleep(paused)
+                # 止めている間にトークンが貯まらないようにする。
+                self.tokens, self.updated_at = 0, time.monotonic()
+            self._refill()
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+
+class HostThrottle:
+    """
+        parameters:
+            rate: 最初の1秒あたりのリクエスト数。成功が続けば rate * rate_headroom まで上げる。
+            max_concurrency: このホストへの同時リクエスト数の上限
+
+        ホストごとのペース(トークンバケット)と同時リクエスト数をAIMDで調整する。
+    """
+
+    def __init__(self, rate, max_concurrency):
+        self.bucket = TokenBucket(rate)
+        self.max_rate = rate * rate_headroom
+        self.rate_step = rate * rate_increase
+        self.max_concurrency = max_concurrency
+        # 最初は1本から始めて、成功するごとに増やす。
+        self.concurrency = 1.0
+        self.in_flight = 0
+        self.decreased_at = 0.0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        await self.bucket.acquire()
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.concurrency))
+            self.in_flight += 1
+
+    async def release(self):
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self):
+        self.bucket.rate = min(self.max_rate, self.bucket.rate + self.rate_step)
+        self.concurrency = min(self.max_concurrency,
+                               self.concurrency + 1 / self.concurrency)
+
+    def on_throttle(self, retry_after=None):
+        if retry_after is not None:
+            self.bucket.pause(retry_after)
+        # 同時に送っていたリクエストがまとめて失敗しても、下げるのは1回分だけにする。
+        now = time.monotonic()
+        if now - self.decreased_at < max(1.0, 1 / self.bucket.rate):
+            return
+        self.decreased_at = now
+        self.bucket.rate = max(min_rate, self.bucket.rate / 2)
+        self.concurrency = max(1.0, self.concurrency / 2)
+
+
+class Fetcher:
+    """
+        parameters:
+            max_workers: 同時に実行するリクエストの最大数。Noneの場合は default_max_workers
+            rates: ホスト名をキー、最初の1秒あたりのリクエスト数を値とするdict。
+                   ローカルのスタブサーバーに対して試すときは {'127.0.0.1': 100} などを渡す。
+            session: http_session.CachingSession。Noneの場合はプロセスで共有のセッションを使う。
+
+        使い方:
+            async with Fetcher() as fetcher:
+                responses = await fetcher.fetch_all(urls)
+    """
+
+    def __init__(self, max_workers=None, rates=None, session=None):
+        self.max_workers = max_workers or default_max_workers
+        self.rates = dict(host_rates if rates is None else rates)
+        self.session = session or get_session()
+        self._throttles = dict()
+        self._semaphore = None
+        self._executor = None
+
+    async def __aenter__(self):
+        self._semaphore = asyncio.Semaphore(self.max_workers)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._executor.shutdown(wait=True)
+
+    def _throttle_for(self, host):
+        if host not in self._throttles:
+            self._throttles[host] = HostThrottle(
+                self.rates.get(host, default_rate), self.max_workers)
+        return self._throttles[host]
+
+    async def _get(self, url, throttle):
+        # トークン待ちの間にワーカーを占有しないよう、先にホストの枠を取得する。
+        with metrics.timer('fetch_wait_seconds', host=urlsplit(url).hostname):
+            await throttle.acquire()
+        try:
+            async with self._semaphore:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(
+                    self._executor, partial(self.session.get, url, timeout=request_timeout))
+        finally:
+            await throttle.release()
+
+    async def fetch(self, url):
+        """
+            ホストの枠を取得してからurlをgetし、responseを返す。
+            429/5xxや接続エラーは max_retries 回までリトライする。
+            リトライしきれなかった場合は最後のresponseを返すか、最後の例外を投げる。
+        """
+        host = urlsplit(url).hostname
+        throttle = self._throttle_for(host)
+        for attempt in range(max_retries + 1):
+            try:
+                response = await self._get(url, throttle)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                throttle.on_throttle()
+                if attempt == max_retries:
+                    raise
+                metrics.inc('http_retries_total', host=host, reason=type(e).__name__)
+                await asyncio.sleep(backoff_delay(attempt))
+                continue
+
+            if response.status_code not in retry_statuses:
+                throttle.on_success()
+                return response
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            throttle.on_throttle(retry_after)
+            if attempt == max_retries:
+                return response
+            metrics.inc('http_retries_total', host=host, reason=response.status_code)
+            # Retry-Afterがあればホスト全体が止まるので、ここではバケットのトークンを待つだけでよい。
+            if retry_after is None:
+                await asyncio.sleep(backoff_delay(attempt))
+
+    async def fetch_all(self, urls):
+        """
+            urlsを全て並列にfetchし、渡された順番どおりにresponseの配列を返す。
+        """
+        return await asyncio.gather(*[self.fetch(url) for url in urls])
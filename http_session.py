@@ -0,0 +1,211 @@
+"""
+-----------------------------------------------------------------------
+-- 共有HTTPセッション --------------------------------------------------
+-----------------------------------------------------------------------
+
+    crawlerの全てのリクエストはここのセッションを通す。
+        - keep-aliveでコネクションをプールし、ホストごとのTCP/TLSのハンドシェイクを一度で済ませる。
+        - Accept-Encodingでgzip(brotliが入っていればbrも)を要求する。
+        - ETag/Last-Modifiedを保存しておき、次のrunでは条件付きリクエストを送る。
+          ページが変わっていなければ304が返ってくるので、保存しておいた本文をそのまま使う。
+          ETag/Last-Modifiedはページストアのhttp_cacheテーブルに保存し、本文はページストアのblobsをsha256で指す。
+          (crawlerがページストアに保存する本文と同じものなので、2つ目のコピーは持たない)
+        - --record を渡すと全てのレスポンスをカセットに記録し、--replay を渡すと再生サーバーにリクエストを送る。
+          (cassette.py を参照)
+
+-----------------------------------------------------------------------
+-----------------------------------------------------------------------
+
+
+"""
+
+# Imports
+import json
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from cassette import Cassette, replay_url
+from metrics import metrics
+from page_store import PageStore, store_path
+
+default_pool_size = 16
+
+
+def accept_encoding():
+    """
+        urllib3がbrotliを展開できる場合だけbrを要求する。
+    """
+    encodings = ['gzip', 'deflate']
+    try:
+        import brotli  # noqa: F401
+        encodings.append('br')
+    except ImportError:
+        try:
+            import brotlicffi  # noqa: F401
+            encodings.append('br')
+        except ImportError:
+            pass
+    return ', '.join(encodings)
+
+
+class CachingSession:
+    """
+        parameters:
+            cache_path: ETag/Last-Modifiedと本文を保存するページストアのパス。Noneの場合はキャッシュしない。
+            pool_size: ホストごとに保持するコネクション数。並列にfetchするワーカー数以上にしておく。
+
+        requests.Sessionの薄いラッパー。get()はrequests.Responseを返し、
+        304でキャッシュから返した場合は response.from_cache が True になる。
+
+        cassetteにcassette.Cassetteを設定すると、全てのレスポンスを記録する。
+        replay_base_urlを設定すると、リクエストを再生サーバーに送る。(メトリクスのhostは元のホストのまま)
+    """
+
+    def __init__(self, cache_path=store_path, pool_size=default_pool_size):
+        self.cache_path = cache_path
+        # 最初にキャッシュを使うときに開く。
+        self._store = None
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers['Accept-Encoding'] = accept_encoding()
+        self._lock = threading.Lock()
+        self.cassette = None
+        self.replay_base_url = None
+
+    def _cache(self):
+        # fetcherのスレッドプールから同時に呼ばれるので、self._lockを取ってから呼ぶこと。
+        # 相対パスはカレントディレクトリで変わるので、絶対パスで比べる。
+        path = os.path.abspath(self.cache_path)
+        if self._store is None or self._store.path != path:
+            if self._store is not None:
+                self._store.close()
+            self._store = PageStore(path, check_same_thread=False)
+            self._store.conn.execute("""
+                CREATE TABLE IF NOT EXISTS http_cache (
+                    url TEXT PRIMARY KEY,
+                    etag TEXT,
+                    last_modified TEXT,
+                    encoding TEXT,
+                    headers TEXT NOT NULL,
+                    hash TEXT NOT NULL REFERENCES blobs (hash),
+                    stored_at REAL NOT NULL
+                )""")
+            self._store.conn.commit()
+        return self._store
+
+    def _load(self, url):
+        with self._lock:
+            store = self._cache()
+            row = store.conn.execute(
+                'SELECT etag, last_modified, encoding, headers, hash FROM http_cache WHERE url = ?', (url,)).fetchone()
+            body = None if row is None else store.get_blob(row[4])
+        # 本文のblobが消されていれば、キャッシュがないものとして条件なしで取り直す。
+        if body is None:
+            return None, None
+        meta = {'ETag': row[0], 'Last-Modified': row[1], 'encoding': row[2], 'headers': json.loads(row[3])}
+        return meta, body
+
+    def _save(self, url, response):
+        validators = (response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        if not any(validators):
+            return
+        with self._lock:
+            store = self._cache()
+            # 本文とETag/Last-Modifiedは1つのトランザクションで書くので、途中で落ちても片方だけは残らない。
+            with store.conn:
+                content_hash = store.put_blob(response.content)
+                store.conn.execute(
+                    'INSERT OR REPLACE INTO http_cache (url, etag, last_modified, encoding, headers, hash, stored_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (url, *validators, response.encoding, json.dumps(dict(response.headers)), content_hash,
+                     time.time()))
+
+    def get(self, url, **kwargs):
+        meta, body = (None, None) if self.cache_path is None else self._load(url)
+        headers = dict(kwargs.pop('headers', None) or {})
+        if meta is not None:
+            if meta.get('ETag'):
+                headers['If-None-Match'] = meta['ETag']
+            if meta.get('Last-Modified'):
+                headers['If-Modified-Since'] = meta['Last-Modified']
+
+        host = urlsplit(url).hostname
+        start = time.perf_counter()
+        try:
+            request_url = url if self.replay_base_url is None else replay_url(self.replay_base_url, url)
+            response = self.session.get(request_url, headers=headers, **kwargs)
+        except requests.RequestException as e:
+            metrics.inc('http_errors_total', host=host, error=type(e).__name__)
+            raise
+        finally:
+            metrics.observe('http_request_seconds', time.perf_counter() - start, host=host)
+        response.from_cache = False
+        metrics.inc('http_requests_total', host=host, status=response.status_code)
+        metrics.inc('http_response_bytes_total', len(response.content), host=host)
+
+        if response.status_code == 304 and meta is not None:
+            # 変更がなかったので保存しておいた本文を200として返す。
+            response.status_code = 200
+            response._content = body
+            response.encoding = meta.get('encoding')
+            response.headers.update(meta.get('headers', {}))
+            response.from_cache = True
+            metrics.inc('http_cache_hits_total', host=host)
+        elif response.status_code == 200 and self.cache_path is not None:
+            self._save(url, response)
+        if self.cassette is not None:
+            self.cassette.record(url, response)
+        return response
+
+    def close(self):
+        self.session.close()
+        with self._lock:
+            if self._store is not None:
+                self._store.close()
+                self._store = None
+
+
+_shared_session = None
+_shared_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+        プロセス内で共有するCachingSessionを返す。
+    """
+    global _shared_session
+    with _shared_session_lock:
+        if _shared_session is None:
+            _shared_session = CachingSession()
+    return _shared_session
+
+
+def configure(record=None, replay=None):
+    """
+        コマンドラインの --record と --replay を共有セッションに設定する。
+        再生するときはHTTPキャッシュを使わず、毎回再生サーバーに送る。
+    """
+    session = get_session()
+    if record is not None:
+        session.cassette = Cassette(record)
+    if replay is not None:
+        session.replay_base_url = replay
+        session.cache_path = None
+
+
+def add_arguments(parser):
+    """
+        --record と --replay をargparseに加える。
+    """
+    parser.add_argument('--record', metavar='CASSETTE', default=None,
+                        help='record every response into this cassette file')
+    parser.add_argument('--replay', metavar='URL', default=None,
+                        help='send every request to this replay server instead of the live sites')
@@ -0,0 +1,115 @@
+"""
+-----------------------------------------------------------------------
+-- Crawlマニフェスト ---------------------------------------------------
+-----------------------------------------------------------------------
+
+    crawlしたページをSQLiteに記録しておき、途中で落ちても続きからcrawlできるようにする。
+    1ページにつき1行で、以下を保存する。
+        - path: 出力先のファイルパス、またはページストアのキー(主キー)
+        - url: 実際にfetchしたURL
+        - status: 'done'(保存済み)、'not_found'(戦績ページが存在しない)、'failed'(失敗)
+        - fetched_at: fetchした時刻(UNIX時間)
+        - content_hash: 保存した本文のsha256
+
+    'done'と'not_found'で、まだ新しいページは再実行時にスキップされる。
+    'failed'のページと古くなったページだけが再度crawlされる。
+
+-----------------------------------------------------------------------
+-----------------------------------------------------------------------
+
+
+"""
+
+# Imports
+import hashlib
+import os
+import sqlite3
+import time
+
+manifest_path = './crawl_exports/manifest.sqlite3'
+
+STATUS_DONE = 'done'
+STATUS_NOT_FOUND = 'not_found'
+STATUS_FAILED = 'failed'
+
+
+class CrawlManifest:
+    """
+        parameters:
+            path: マニフェストのSQLiteファイルのパス
+            max_age_days: これより古いページは再度crawlする。Noneの場合は古さを気にしない。
+    """
+
+    def __init__(self, path=manifest_path, max_age_days=None):
+        self.path = path
+        self.max_age_days = max_age_days
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS pages (
+                path TEXT PRIMARY KEY,
+                url TEXT,
+                status TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                content_hash TEXT
+            )""")
+        self.conn.commit()
+
+    def status(self, path):
+        """
+            pathのページのstatusを返す。記録がなければNone。
+        """
+        row = self.conn.execute(
+            'SELECT status FROM pages WHERE path = ?', (path,)).fetchone()
+        return None if row is None else row[0]
+
+    def is_fresh(self, path, exists=os.path.exists):
+        """
+            pathのページが保存済みで、まだ新しければTrueを返す。
+            exists: 保存先に実際にページがあるかを確かめる関数。ページストアに保存している場合に差し替える。
+        """
+        row = self.conn.execute(
+            'SELECT status, fetched_at FROM pages WHERE path = ?', (path,)).fetchone()
+        if row is None:
+            return False
+        status, fetched_at = row
+        if status not in (STATUS_DONE, STATUS_NOT_FOUND):
+            return False
+        # マニフェストにあってもファイルが消されていればcrawlし直す。
+        if not exists(path):
+            return False
+        if self.max_age_days is not None and time.time() - fetched_at > self.max_age_days * 86400:
+            return False
+        return True
+
+    def record(self, path, url, status, content=None):
+        content_hash = None
+        if content is not None:
+            if isinstance(content, str):
+                content = content.encode('utf-8')
+            content_hash = hashlib.sha256(content).hexdigest()
+        self.conn.execute(
+            'INSERT OR REPLACE INTO pages (path, url, status, fetched_at, content_hash) VALUES (?, ?, ?, ?, ?)',
+            (path, url, status, time.time(), content_hash))
+        self.conn.commit()
+
+    def rename_paths(self, renames):
+        """
+            parameters:
+                renames: (古いpath, 新しいpath) の配列。新しいpathがすでにある行は古いpathの方を消す。
+        """
+        with self.conn:
+            for old_path, new_path in renames:
+                self.conn.execute('UPDATE OR IGNORE pages SET path = ? WHERE path = ?', (new_path, old_path))
+                self.conn.execute('DELETE FROM pages WHERE path = ?', (old_path,))
+
+    def status_counts(self):
+        """
+            statusごとのページ数をdictで返す。
+        """
+        return dict(self.conn.execute('SELECT status, COUNT(*) FROM pages GROUP BY status').fetchall())
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,215 @@
+"""
+-----------------------------------------------------------------------
+-- 計測 ----------------------------------------------------------------
+-----------------------------------------------------------------------
+
+    crawlとscrapeのrunの中で、どこに時間がかかっているかを記録する。
+        - カウンター: inc('http_requests_total', host=..., status=...)
+        - 時間などの観測値: observe('parse_seconds', 0.002, table='receiving') (回数、合計、最大を持つ)
+        - timer(): withで囲んだ処理の時間をobserveする
+        - span(): フェーズの時間を 'phase_seconds' にobserveする。プロファイルを有効にしていれば、
+                  フェーズごとにcProfileを取って {profile_dir}/{phase}.prof に保存する。
+
+    記録した値は write_report() でJSONのrunレポートか、Prometheusのテキスト形式(.prom)で書き出す。
+
+    値はプロセスごとに持つ。scraperのワーカープロセスで記録した値は drain() で取り出して、
+    親プロセスで merge() する。
+
+    主な値:
+        http_requests_total{host,status}     ホストごとのリクエスト数
+        http_response_bytes_total{host}      受け取った本文のバイト数
+        http_cache_hits_total{host}          304でキャッシュの本文を使った数
+        http_request_seconds{host}           リクエストにかかった時間
+        fetch_wait_seconds{host}             レート制限のトークン待ちの時間
+        resolver_probes_total                同姓同名の選手ページを調べたリクエスト数
+        resolver_probes_per_player           1選手あたりのページを調べた回数
+        resolver_stale_candidates_total      インデックスの候補のページが404になり、調べ直した選手の数
+        parse_seconds{table}                 テーブルごとのparseの時間
+        record_cache_hits_total              ページが変わっておらず、parseせずにキャッシュを使った選手の数
+        record_cache_misses_total            ページが変わったのでparseし直した選手の数
+        scrape_missing_pages_total{kind}     ページストアにページがなく、欠損値のレコードにした選手の数
+        pipeline_scrape_failures_total{error} pipelineでscrapeに失敗して書き出さなかった選手の数
+        phase_seconds{phase}                 フェーズごとの時間
+
+-----------------------------------------------------------------------
+-----------------------------------------------------------------------
+
+
+"""
+
+# Imports
+import cProfile
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+report_format_version = 1
+
+
+def _label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class Metrics:
+    """
+        カウンターと観測値を持つレジストリ。fetcherのスレッドから同時に呼ばれるのでロックをかける。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = dict()
+        # (name, labels) -> [回数, 合計, 最大]
+        self.summaries = dict()
+        self.profile_dir = None
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            summary = self.summaries.setdefault(key, [0, 0.0, value])
+            summary[0] += 1
+            summary[1] += value
+            summary[2] = max(summary[2], value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    @contextmanager
+    def span(self, phase):
+        """
+            フェーズの時間を記録する。profile_dirが設定されていれば、そのフェーズのcProfileも保存する。
+        """
+        profiler = None
+        if self.profile_dir is not None:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        try:
+            with self.timer('phase_seconds', phase=phase):
+                yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                os.makedirs(self.profile_dir, exist_ok=True)
+                profiler.dump_stats(os.path.join(self.profile_dir, '{}.prof'.format(phase)))
+
+    def snapshot(self):
+        with self._lock:
+            return {'counters': dict(self.counters),
+                    'summaries': {key: list(value) for key, value in self.summaries.items()}}
+
+    def drain(self):
+        """
+            今までの値を返して、レジストリを空にする。ワーカープロセスから親プロセスに値を渡すときに使う。
+        """
+        with self._lock:
+            drained = {'counters': self.counters, 'summaries': self.summaries}
+            self.counters, self.summaries = dict(), dict()
+        return drained
+
+    def merge(self, drained):
+        with self._lock:
+            for key, value in drained['counters'].items():
+                self.counters[key] = self.counters.get(key, 0) + value
+            for key, (count, total, maximum) in drained['summaries'].items():
+                summary = self.summaries.setdefault(key, [0, 0.0, maximum])
+                summary[0] += count
+                summary[1] += total
+                summary[2] = max(summary[2], maximum)
+
+    def reset(self):
+        with self._lock:
+            self.counters, self.summaries = dict(), dict()
+
+    def to_json(self):
+        """
+            runレポートのdictを返す。
+        """
+        snapshot = self.snapshot()
+        return {
+            'version': report_format_version,
+            'generated_at': time.time(),
+            'counters': [{'name': name, 'labels': dict(labels), 'value': value}
+                         for (name, labels), value in sorted(snapshot['counters'].items())],
+            'summaries': [{'name': name, 'labels': dict(labels), 'count': count, 'sum': total,
+                           'mean': total / count if count else 0.0, 'max': maximum}
+                          for (name, labels), (count, total, maximum) in sorted(snapshot['summaries'].items())],
+        }
+
+    def to_prometheus(self):
+        """
+            Prometheusのテキスト形式の文字列を返す。観測値は summary の *_count と *_sum で出し、
+            最大値は別の gauge のファミリー *_max として出す。(summaryのファミリーに *_max は入れられない)
+        """
+        def format_labels(labels):
+            if not labels:
+                return ''
+            return '{' + ','.join('{}="{}"'.format(key, value.replace('\\', '\\\\').replace('"', '\\"'))
+                                  for key, value in labels) + '}'
+
+        snapshot = self.snapshot()
+        lines = list()
+        typed = set()
+        for (name, labels), value in sorted(snapshot['counters'].items()):
+            if name not in typed:
+                lines.append('# TYPE {} counter'.format(name))
+                typed.add(name)
+            lines.append('{}{} {}'.format(name, format_labels(labels), value))
+        # 同じファミリーのサンプルは続けて出さないといけないので、名前ごとにまとめる。
+        summaries = defaultdict(list)
+        for (name, labels), value in sorted(snapshot['summaries'].items()):
+            summaries[name].append((labels, value))
+        for name, samples in summaries.items():
+            lines.append('# TYPE {} summary'.format(name))
+            for labels, (count, total, _) in samples:
+                lines.append('{}_count{} {}'.format(name, format_labels(labels), count))
+                lines.append('{}_sum{} {}'.format(name, format_labels(labels), total))
+            lines.append('# TYPE {}_max gauge'.format(name))
+            for labels, (_, _, maximum) in samples:
+                lines.append('{}_max{} {}'.format(name, format_labels(labels), maximum))
+        return '\n'.join(lines) + '\n'
+
+    def write_report(self, path):
+        """
+            拡張子が.promならPrometheusのテキスト形式、それ以外はJSONで書き出す。
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            if path.endswith('.prom'):
+                f.write(self.to_prometheus())
+            else:
+                json.dump(self.to_json(), f, indent=2)
+
+
+# プロセスで共有するレジストリ
+metrics = Metrics()
+
+
+def configure(profile_dir=None):
+    """
+        コマンドラインの --profile-dir を受け取る。Noneの場合はプロファイルを取らない。
+    """
+    metrics.profile_dir = profile_dir
+
+
+def add_arguments(parser):
+    """
+        --metrics と --profile-dir をargparseに加える。
+    """
+    parser.add_argument('--metrics', default=None,
+                        help='write a run report to this path (Prometheus text if it ends in .prom, JSON otherwise)')
+    parser.add_argument('--profile-dir', default=None,
+                        help='save a cProfile dump per phase to this directory')
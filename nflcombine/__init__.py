@@ -0,0 +1,32 @@
+"""
+-----------------------------------------------------------------------
+-- コマンドラインのエントリーポイント --------------------------------------
+-----------------------------------------------------------------------
+
+    python -m nflcombine <サブコマンド> [引数...]
+
+        crawl        crawler.main()     Combineの結果と大学時代の戦績をcrawlする
+        scrape       scraper.main()     ページストアからscrapeしてoutput.csvを書き出す
+        pipeline     pipeline.main()    crawlとscrapeを同時に進める
+        draft-index  draft_index.main() ドラフト指名のインデックスを作り直す
+        db           player_db.main()   output.csvをSQLiteに入れて、パーセンタイルや順位を出す
+        status       nflcombine.status  crawlとscrapeの進み具合を表示する
+
+    サブコマンドのモジュールは選ばれたときにだけimportするので、statusや --help では
+    pandas、bs4、lxmlなどを読み込まない。サブコマンドの引数はそのまま各モジュールの main(argv) に渡す。
+
+-----------------------------------------------------------------------
+-----------------------------------------------------------------------
+
+
+"""
+
+# サブコマンド → (モジュール名, ヘルプ)
+commands = {
+    'crawl': ('crawler', 'crawl combine results and college stats'),
+    'scrape': ('scraper', 'scrape the page store into output.csv'),
+    'pipeline': ('pipeline', 'crawl and scrape concurrently'),
+    'draft-index': ('draft_index', 'rebuild the draft pick index'),
+    'db': ('player_db', 'load output.csv into SQLite and run percentile/ranking queries'),
+    'status': ('nflcombine.status', 'show crawl and scrape progress'),
+}
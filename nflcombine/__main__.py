@@ -0,0 +1,32 @@
+"""
+    python -m nflcombine <サブコマンド> [引数...]
+"""
+
+# Imports
+import argparse
+import importlib
+import os
+import sys
+
+# crawler.pyなどのモジュールはリポジトリの直下にあるので、どこから実行してもimportできるようにする。
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from nflcombine import commands  # noqa: E402
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='nflcombine',
+                                     description='Crawl and scrape NFL combine results and college stats.')
+    subparsers = parser.add_subparsers(dest='command', required=True, metavar='command')
+    for name, (_, help_text) in commands.items():
+        # 引数の解釈は各モジュールのmain()に任せる。
+        subparsers.add_parser(name, help=help_text, add_help=False)
+    args, rest = parser.parse_known_args(argv)
+
+    module_name, _ = commands[args.command]
+    # 各モジュールの --help の usage に 'nflcombine crawl' のように出るようにする。
+    sys.argv[0] = 'nflcombine ' + args.command
+    return importlib.import_module(module_name).main(rest)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
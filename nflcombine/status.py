@@ -0,0 +1,69 @@
+"""
+    crawlとscrapeの進み具合を表示する。
+        manifest: statusごとのページ数
+        work_queue: statusごとのシャード数
+        page_store: ページ数と圧縮前後のサイズ
+        scrape: 書き出し済みのチャンクと選手の数
+
+    SQLiteとJSONを読むだけなので、pandasなどは読み込まない。まだないファイルは作らずに飛ばす。
+"""
+
+# Imports
+import argparse
+import json
+import os
+
+import work_queue
+from manifest import CrawlManifest, manifest_path
+from page_store import PageStore, store_path
+
+# output_writerはrecordsを読み込むので、パスだけここに持っておく。(output_writer.chunk_directory_pathと同じ)
+progress_path = './crawl_exports/output_chunks/progress.json'
+
+
+def crawl_status(manifest=manifest_path, queue=work_queue.queue_path, store=store_path, progress=progress_path):
+    """
+        returns:
+            {'manifest': ..., 'work_queue': ..., 'page_store': ..., 'scrape': ...} のdict。
+            ファイルがないものはNone。
+    """
+    status = dict.fromkeys(['manifest', 'work_queue', 'page_store', 'scrape'])
+    if os.path.exists(manifest):
+        crawl_manifest = CrawlManifest(manifest)
+        status['manifest'] = crawl_manifest.status_counts()
+        crawl_manifest.close()
+    if os.path.exists(queue):
+        shard_queue = work_queue.WorkQueue(queue)
+        status['work_queue'] = shard_queue.status_counts()
+        shard_queue.close()
+    if os.path.exists(store):
+        page_store = PageStore(store)
+        status['page_store'] = page_store.stats()
+        page_store.close()
+    if os.path.exists(progress):
+        with open(progress, encoding='utf-8') as f:
+            chunk_progress = json.load(f)
+        status['scrape'] = {'chunks': chunk_progress['chunks'], 'records': chunk_progress['records']}
+    return status
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='nflcombine status', description='Show crawl and scrape progress.')
+    parser.add_argument('--manifest', default=manifest_path)
+    parser.add_argument('--queue', default=work_queue.queue_path)
+    parser.add_argument('--store', default=store_path)
+    parser.add_argument('--progress', default=progress_path)
+    parser.add_argument('--json', action='store_true',
+                        help='print the status as JSON')
+    args = parser.parse_args(argv)
+
+    status = crawl_status(args.manifest, args.queue, args.store, args.progress)
+    if args.json:
+        print(json.dumps(status, indent=2))
+        return
+    for section, values in status.items():
+        if values is None:
+            print('{:<12} -'.format(section))
+            continue
+        print('{:<12} {}'.format(section, ', '.join(
+            '{}={}'.format(key, value) for key, value in sorted(values.items())) or 'empty'))
@@ -0,0 +1,240 @@
+"""
+-----------------------------------------------------------------------
+-- Scrape結果の書き出し -------------------------------------------------
+-----------------------------------------------------------------------
+
+    output.csvとは別に、records.dtypesの型を付けたParquetをDraftYearごとに分けて書き出す。
+        {parquet_dir}/DraftYear=2020/xxxx.parquet
+    読む側は必要な列と年だけをメモリマップして読み込める。
+        read_parquet(parquet_dir, columns=[...], filters=[('DraftYear', '>=', 2015)])
+    DraftYearはファイルの中ではなくフォルダ名に入るので、pd.read_parquet(parquet_dir)でそのまま読むとcategoryになる。
+    read_parquet()はフォルダ名をrecords.dtypesどおりのint16として読む。
+
+    Parquetの書き出しにはpyarrowが必要。
+
+    pipeline.pyのようにレコードを少しずつ書き出す場合は append_csv() で追記していく。
+
+    ChunkedWriter はレコードを chunk_size 件ごとのチャンクにしてCSV(とParquet)に書き出し、
+    書き終えたチャンクの数を progress.json に記録する。メモリに持つのは1チャンク分だけになる。
+        - CSVのチャンクは一時ファイルに書いてからリネームするので、途中で落ちても壊れたチャンクは残らない。
+        - 途中で落ちた場合は、次のrunで記録されているチャンクの後ろから再開できる。
+          記録される前に書かれていたParquetのファイルは再開するときに消す。
+        - 最後に close() でチャンクをつなげてoutput.csvにする。
+
+-----------------------------------------------------------------------
+-----------------------------------------------------------------------
+
+
+"""
+
+# Imports
+import glob
+import hashlib
+import json
+import os
+import re
+import shutil
+
+from records import dtypes, measurement_columns, records_to_dict, to_typed_frame
+
+chunk_directory_path = './crawl_exports/output_chunks'
+default_chunk_size = 1000
+
+chunk_file_pattern = re.compile(r'^part-(\d+)-')
+
+
+def read_parquet(parquet_dir, columns=None, filters=None):
+    """
+        ChunkedWriterが書き出したParquetを、DraftYearをint16にして読み込む。
+        parameters:
+            columns: 読み込む列。Noneの場合は全ての列
+            filters: pyarrowのfilters。例: [('DraftYear', '>=', 2015)]
+    """
+    _require_pyarrow()
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    partitioning = ds.partitioning(pa.schema([('DraftYear', pa.from_numpy_dtype(dtypes['DraftYear']))]),
+                                   flavor='hive')
+    return pd.read_parquet(parquet_dir, engine='pyarrow', columns=columns, filters=filters,
+                           partitioning=partitioning)
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise ImportError(
+            'writing Parquet output requires pyarrow (pip install pyarrow)')
+
+
+def _csv_frame(records):
+    """
+        PlayerRecordの配列をoutput.csvと同じ列のDataFrameにする。
+        何回かに分けて書き出しても、バッチによって整数と浮動小数点が混ざらないように揃える。
+    """
+    import pandas as pd
+
+    data_df = pd.DataFrame(records_to_dict(records))
+    data_df[measurement_columns] = data_df[measurement_columns].astype('float64')
+    return data_df
+
+
+def append_csv(records, output_path):
+    """
+        PlayerRecordの配列をoutput.csvと同じ列でoutput_pathに追記する。ファイルがなければヘッダーも書く。
+    """
+    write_header = not os.path.exists(output_path)
+    _csv_frame(records).to_csv(output_path, mode='a', header=write_header, index=False)
+
+
+def _write_atomic(path, write):
+    tmp_path = path + '.tmp'
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def input_fingerprint(players):
+    """
+        scrapeする選手の一覧のハッシュ。一覧が変わっていたら続きから再開せずに最初からやり直す。
+    """
+    digest = hashlib.sha256()
+    for player in players:
+        digest.update(repr(tuple(player)).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ChunkedWriter:
+    """
+        parameters:
+            chunk_dir: チャンクとprogress.jsonを置くフォルダ
+            chunk_size: 1チャンクのレコード数
+            parquet_dir: 渡された場合はチャンクごとにDraftYearで分けたParquetも書き出す
+            fingerprint: input_fingerprint()の値。progress.jsonの値と違えば最初からやり直す。
+
+        使い方:
+            writer = ChunkedWriter(fingerprint=input_fingerprint(players))
+            done = writer.resume()          # 書き出し済みのレコード数
+            for records in ...(players[done:]):
+                writer.add(records)
+            writer.close('output.csv')
+    """
+
+    def __init__(self, chunk_dir=chunk_directory_path, chunk_size=default_chunk_size, parquet_dir=None, fingerprint=None):
+        if parquet_dir is not None:
+            _require_pyarrow()
+        self.chunk_dir = chunk_dir
+        self.chunk_size = chunk_size
+        self.parquet_dir = parquet_dir
+        self.fingerprint = fingerprint
+        self.progress_path = os.path.join(chunk_dir, 'progress.json')
+        self.chunks = 0
+        self.records_written = 0
+        self._buffer = list()
+
+    def _chunk_path(self, number):
+        return os.path.join(self.chunk_dir, 'part-{:05d}.csv'.format(number))
+
+    def _parquet_parts(self):
+        # parquet_dirはユーザーが渡したフォルダなので、このクラスが書いたファイルだけを扱う。
+        return glob.glob(os.path.join(self.parquet_dir, 'DraftYear=*', 'part-*.parquet'))
+
+    def resume(self):
+        """
+            前回のrunの続きから再開できれば、書き出し済みのレコード数を返す。できなければ最初からやり直して0を返す。
+        """
+        progress = None
+        if os.path.exists(self.progress_path):
+            with open(self.progress_path, encoding='utf-8') as f:
+                progress = json.load(f)
+        if progress is None or progress.get('fingerprint') != self.fingerprint \
+                or progress.get('parquet_dir') != self.parquet_dir:
+            return self.start_over()
+
+        self.chunks = progress['chunks']
+        self.records_written = progress['records']
+        # 記録される前に落ちたチャンクのファイルを消す。
+        for path in glob.glob(os.path.join(self.chunk_dir, 'part-*.csv*')):
+            match = re.match(r'^part-(\d+)\.csv$', os.path.basename(path))
+            if match is None or int(match.group(1)) >= self.chunks:
+                os.remove(path)
+        if self.parquet_dir is not None:
+            for path in self._parquet_parts():
+                match = chunk_file_pattern.match(os.path.basename(path))
+                if match is not None and int(match.group(1)) >= self.chunks:
+                    os.remove(path)
+        return self.records_written
+
+    def start_over(self):
+        """
+            前回のrunのチャンクとParquetを消して、最初から書き出す。0を返す。
+            parquet_dirはフォルダごとではなく、このクラスが書いた DraftYear=*/part-*.parquet だけを消す。
+        """
+        if os.path.exists(self.chunk_dir):
+            shutil.rmtree(self.chunk_dir)
+        os.makedirs(self.chunk_dir)
+        if self.parquet_dir is not None:
+            for path in self._parquet_parts():
+                os.remove(path)
+            # 空になったDraftYearのフォルダも消す。他のファイルが入っていれば残す。
+            for directory in glob.glob(os.path.join(self.parquet_dir, 'DraftYear=*')):
+                if os.path.isdir(directory) and not os.listdir(directory):
+                    os.rmdir(directory)
+        self.chunks = 0
+        self.records_written = 0
+        self._save_progress()
+        return 0
+
+    def _save_progress(self):
+        progress = {'fingerprint': self.fingerprint, 'parquet_dir': self.parquet_dir,
+                    'chunks': self.chunks, 'records': self.records_written}
+
+        def write(path):
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(progress, f)
+        _write_atomic(self.progress_path, write)
+
+    def add(self, records):
+        self._buffer.extend(records)
+        while len(self._buffer) >= self.chunk_size:
+            self._flush(self._buffer[:self.chunk_size])
+            del self._buffer[:self.chunk_size]
+
+    def _flush(self, records):
+        if not records:
+            return
+        data_df = _csv_frame(records)
+        _write_atomic(self._chunk_path(self.chunks),
+                      lambda path: data_df.to_csv(path, index=False))
+        if self.parquet_dir is not None:
+            to_typed_frame(data_df).to_parquet(
+                self.parquet_dir, engine='pyarrow', partition_cols=['DraftYear'], index=False,
+                basename_template='part-{:05d}-{{i}}.parquet'.format(self.chunks))
+        # チャンクのファイルを全て書き終えてから記録する。
+        self.chunks += 1
+        self.records_written += len(records)
+        self._save_progress()
+
+    def close(self, output_path):
+        """
+            残っているレコードを書き出し、全てのチャンクをつなげてoutput_pathに書き出す。
+            書き出せたらチャンクのフォルダは消す。
+        """
+        self._flush(self._buffer)
+        self._buffer = list()
+
+        def write(path):
+            if self.chunks == 0:
+                _csv_frame([]).to_csv(path, index=False)
+                return
+            with open(path, 'wb') as output:
+                for number in range(self.chunks):
+                    with open(self._chunk_path(number), 'rb') as chunk:
+                        # 2つ目以降のチャンクはヘッダーを飛ばす。
+                        if number > 0:
+                            chunk.readline()
+                        shutil.copyfileobj(chunk, output)
+        _write_atomic(output_path, write)
+        shutil.rmtree(self.chunk_dir)
+        return self.records_written
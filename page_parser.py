@@ -0,0 +1,135 @@
+"""
+-----------------------------------------------------------------------
+-- ページのparse --------------------------------------------------------
+-----------------------------------------------------------------------
+
+    crawlしたページから、scraperで使うノードだけを取り出す。
+    html.parserで全体のBeautifulSoupを作る代わりに、lxmlで1回だけparseしてxpathで必要なノードを拾う。
+        Combineの結果詳細ページ: table.tableperc
+        大学時代の戦績ページ: #meta, stat_tables のテーブル
+
+    sports-referenceは#receiving以外のテーブル(kick_ret, punt_ret, rushing, defenseなど)をコメントで覆っている。
+    コメントごとにparseし直す代わりに、元のhtmlを正規表現で1回だけ走査してテーブルを含むコメントを集め、
+    まとめて1回parseしてidで引けるようにする。
+
+-----------------------------------------------------------------------
+-----------------------------------------------------------------------
+
+
+"""
+
+# Imports
+# lxmlは重いので、使う関数の中でimportする。(scraperやpipelineの --help では読み込まない)
+import re
+
+from metrics import metrics
+
+# parse_stats_page()が読むテーブルのid
+stat_tables = ('receiving', 'kick_ret', 'punt_ret', 'rushing', 'defense')
+
+comment_pattern = re.compile(r'<!--(.*?)-->', re.S)
+
+
+def _cell_texts(row):
+    return [cell.text_content() for cell in row.xpath('.//td')]
+
+
+def _table_rows(table):
+    """
+        returns:
+            (<list>last_row, <list>footer) tbodyの最後の行とtfootの'td'のテキストの配列
+    """
+    body_rows = table.xpath('./tbody/tr')
+    footers = table.xpath('./tfoot')
+    last_row = _cell_texts(body_rows[-1]) if body_rows else None
+    footer = _cell_texts(footers[0]) if footers else None
+    return last_row, footer
+
+
+def parse_combine_page(content):
+    """
+        parameters:
+            content: Combineの結果詳細ページのhtml
+        returns:
+            table.tablepercの各行の'td'のテキストの配列。テーブルがなければNone。
+    """
+    import lxml.html
+
+    with metrics.timer('parse_seconds', table='combine'):
+        tree = lxml.html.fromstring(content)
+        tables = tree.xpath("//table[@class='tableperc']")
+        if not tables:
+            return None
+        return [_cell_texts(row) for row in tables[0].xpath('.//tr')]
+
+
+def find_hidden_tables(content):
+    """
+        parameters:
+            content: ページのhtml
+        returns:
+            コメントで覆われたテーブルの id → lxmlのtable要素 のdict
+    """
+    import lxml.html
+
+    # テーブルを含むコメントだけを1つの断片にまとめて、1回でparseする。
+    hidden = [comment for comment in comment_pattern.findall(content) if '<table' in comment]
+    if not hidden:
+        return dict()
+    fragment = lxml.html.fragment_fromstring(''.join(hidden), create_parent='div')
+    tables = dict()
+    for table in fragment.xpath('.//table[@id]'):
+        tables.setdefault(table.get('id'), table)
+    return tables
+
+
+def read_hidden_tables(content):
+    """
+        コメントで覆われた全てのテーブルを、id → {'rows': tbodyの各行の'td'のテキストの配列, 'footer': tfootの'td'のテキストの配列} のdictで返す。
+    """
+    tables = dict()
+    for table_id, table in find_hidden_tables(content).items():
+        footers = table.xpath('./tfoot')
+        tables[table_id] = {'rows': [_cell_texts(row) for row in table.xpath('./tbody/tr')],
+                            'footer': _cell_texts(footers[0]) if footers else None}
+    return tables
+
+
+def parse_stats_page(content):
+    """
+        parameters:
+            content: 大学時代の戦績ページのhtml
+        returns:
+            {
+                'meta': #metaのhtml(なければNone),
+                stat_tablesの各id: (最後の年の'td'の配列, 通算の'td'の配列) (なければNone),
+            }
+    """
+    import lxml.html
+
+    parsed = {'meta': None}
+    parsed.update((table_id, None) for table_id in stat_tables)
+    if not content.strip():
+        return parsed
+    with metrics.timer('parse_seconds', table='stats_page'):
+        tree = lxml.html.fromstring(content)
+
+    with metrics.timer('parse_seconds', table='meta'):
+        meta = tree.xpath("//*[@id='meta']")
+        if meta:
+            parsed['meta'] = lxml.html.tostring(meta[0], encoding='unicode')
+
+    with metrics.timer('parse_seconds', table='hidden_tables'):
+        tables = find_hidden_tables(content)
+    # 見えているテーブルがあればそちらを使う。
+    visible = dict()
+    for table in tree.xpath('//table[@id]'):
+        visible.setdefault(table.get('id'), table)
+    tables.update(visible)
+
+    for table_id in stat_tables:
+        if table_id in tables:
+            with metrics.timer('parse_seconds', table=table_id):
+                parsed[table_id] = _table_rows(tables[table_id])
+
+    return parsed
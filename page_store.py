@@ -0,0 +1,257 @@
+"""
+-----------------------------------------------------------------------
+-- ページストア --------------------------------------------------------
+-----------------------------------------------------------------------
+
+    crawlしたページを1つのSQLiteファイルにまとめて保存する。
+        - 本文はsha256で内容アドレス化し、同じ本文は1回しか保存しない。
+          ("Stats not found"のページなどは全選手で1つになる)
+        - 本文はzstdで圧縮する。zstandardが入っていなければzlibで圧縮する。
+        - ページは (kind, 選手のキー) で引ける。選手のキーには大学名も含めるので、同姓同名の選手でも衝突しない。
+        - http_sessionのHTTPキャッシュも本文はここのblobsを使い、ETag/Last-Modifiedとハッシュだけを持つ。
+
+    kind:
+        'combine': Combineの結果詳細ページ
+        'stats': 大学時代の戦績ページ
+
+    以前のレイアウト(crawl_exports/combine_results, crawl_exports/college_stats)のファイルは
+        python page_store.py
+    で取り込める。同時に、以前のキー(player_identity.legacy_player_key)で保存したページ、マニフェストの行、
+    レコードのキャッシュを今のキーに移す。
+
+-----------------------------------------------------------------------
+-----------------------------------------------------------------------
+
+
+"""
+
+# Imports
+import hashlib
+import os
+import sqlite3
+import time
+import zlib
+
+from player_identity import legacy_player_key, player_key
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+store_path = './crawl_exports/pages.sqlite3'
+
+KIND_COMBINE = 'combine'
+KIND_STATS = 'stats'
+
+
+def _compress(data):
+    if zstandard is not None:
+        return 'zstd', zstandard.ZstdCompressor(level=10).compress(data)
+    return 'zlib', zlib.compress(data, 9)
+
+
+def _decompress(codec, data):
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ImportError(
+                'this page store was written with zstd; install zstandard to read it')
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+class PageStore:
+    """
+        parameters:
+            path: SQLiteファイルのパス
+            check_same_thread: Falseにすると他のスレッドからも使える。その場合は呼び出し側でロックをかけること。
+    """
+
+    def __init__(self, path=store_path, check_same_thread=True):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=60, check_same_thread=check_same_thread)
+        # crawlerが書き込んでいる間もscraperのプロセスが読めるようにWALにする。
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS blobs (
+                hash TEXT PRIMARY KEY,
+                codec TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                data BLOB NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS pages (
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL,
+                hash TEXT NOT NULL REFERENCES blobs (hash),
+                url TEXT,
+                stored_at REAL NOT NULL,
+                PRIMARY KEY (kind, key)
+            );
+            """)
+        self.conn.commit()
+
+    def put_blob(self, content):
+        """
+            本文だけを保存し、sha256を返す。コミットは呼び出し側でする。
+        """
+        data = content.encode('utf-8') if isinstance(content, str) else content
+        content_hash = hashlib.sha256(data).hexdigest()
+        if self.conn.execute('SELECT 1 FROM blobs WHERE hash = ?', (content_hash,)).fetchone() is None:
+            codec, compressed = _compress(data)
+            self.conn.execute('INSERT INTO blobs (hash, codec, size, data) VALUES (?, ?, ?, ?)',
+                              (content_hash, codec, len(data), compressed))
+        return content_hash
+
+    def get_blob(self, content_hash):
+        """
+            sha256から本文をbytesで返す。保存されていなければNone。
+        """
+        row = self.conn.execute('SELECT codec, data FROM blobs WHERE hash = ?', (content_hash,)).fetchone()
+        return None if row is None else _decompress(row[0], row[1])
+
+    def put(self, kind, key, content, url=None):
+        """
+            ページを保存し、本文のsha256を返す。
+        """
+        content_hash = self.put_blob(content)
+        self.conn.execute('INSERT OR REPLACE INTO pages (kind, key, hash, url, stored_at) VALUES (?, ?, ?, ?, ?)',
+                          (kind, key, content_hash, url, time.time()))
+        self.conn.commit()
+        return content_hash
+
+    def get(self, kind, key):
+        """
+            ページの本文を文字列で返す。保存されていなければNone。
+        """
+        row = self.conn.execute(
+            'SELECT blobs.codec, blobs.data FROM pages JOIN blobs ON pages.hash = blobs.hash '
+            'WHERE pages.kind = ? AND pages.key = ?', (kind, key)).fetchone()
+        if row is None:
+            return None
+        return _decompress(row[0], row[1]).decode('utf-8')
+
+    def hash_of(self, kind, key):
+        row = self.conn.execute(
+            'SELECT hash FROM pages WHERE kind = ? AND key = ?', (kind, key)).fetchone()
+        return None if row is None else row[0]
+
+    def has(self, kind, key):
+        return self.hash_of(kind, key) is not None
+
+    def rename_keys(self, renames):
+        """
+            parameters:
+                renames: (古いキー, 新しいキー) の配列。新しいキーがすでにあるページは古いキーの方を消す。
+        """
+        with self.conn:
+            for old_key, new_key in renames:
+                self.conn.execute('UPDATE OR IGNORE pages SET key = ? WHERE key = ?', (new_key, old_key))
+                self.conn.execute('DELETE FROM pages WHERE key = ?', (old_key,))
+
+    def stats(self):
+        """
+            returns:
+                {'pages': ページ数, 'blobs': 本文の数, 'raw_bytes': 圧縮前の合計, 'stored_bytes': 圧縮後の合計}
+        """
+        pages = self.conn.execute('SELECT COUNT(*) FROM pages').fetchone()[0]
+        blobs, raw_bytes, stored_bytes = self.conn.execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(LENGTH(data)), 0) FROM blobs').fetchone()
+        return {'pages': pages, 'blobs': blobs, 'raw_bytes': raw_bytes, 'stored_bytes': stored_bytes}
+
+    def close(self):
+        self.conn.close()
+
+
+_process_store = None
+
+
+def get_store(path=store_path):
+    """
+        プロセスごとに1つだけPageStoreを開いて返す。scraperのワーカープロセスから使う。
+    """
+    global _process_store
+    if _process_store is None or _process_store.path != path:
+        _process_store = PageStore(path)
+    return _process_store
+
+
+def import_loose_files(store, data_dir='./crawl_exports'):
+    """
+        以前のレイアウトで保存されたhtmlファイルをページストアに取り込み、取り込んだ選手の数を返す。
+    """
+    import pandas as pd
+
+    name_year_df = pd.read_csv(os.path.join(
+        data_dir, 'player_name_draft_year_colleges.csv'))
+    imported = 0
+    for name, draft_year, college in zip(name_year_df.Player_Name, name_year_df.Draft_Year, name_year_df.College):
+        # 以前のレイアウトではファイル名に名前の最初の2語を使っていた。1語の名前のファイルは作られていない。
+        words = str(name).split()
+        if len(words) < 2:
+            print('skipping {} ({}): no file name in the old layout for a one-word name'.format(name, draft_year))
+            continue
+        first_name, last_name = words[:2]
+        key = player_key(name, draft_year, college)
+        combine_file_path = os.path.join(data_dir, 'combine_results', '{}_{}_{}.html'.format(
+            first_name, last_name, draft_year))
+        stats_file_path = os.path.join(data_dir, 'college_stats', '{}-{}-{}-stats.html'.format(
+            first_name.lower(), last_name.lower(), draft_year))
+        if os.path.exists(combine_file_path):
+            with open(combine_file_path, 'r', encoding='utf-8') as f:
+                store.put(KIND_COMBINE, key, f.read())
+        if os.path.exists(stats_file_path):
+            with open(stats_file_path, mode='r', encoding='ascii', errors='ignore') as f:
+                store.put(KIND_STATS, key, f.read())
+            imported += 1
+    return imported
+
+
+def legacy_key_renames(data_dir='./crawl_exports'):
+    """
+        選手一覧のCSVから、キーが変わった選手の (古いキー, 新しいキー) の配列を作る。
+    """
+    import pandas as pd
+
+    name_year_df = pd.read_csv(os.path.join(
+        data_dir, 'player_name_draft_year_colleges.csv'))
+    renames = list()
+    for name, draft_year, college in zip(name_year_df.Player_Name, name_year_df.Draft_Year, name_year_df.College):
+        old_key, new_key = legacy_player_key(name, draft_year, college), player_key(name, draft_year, college)
+        # 1語の名前は以前のキーで保存されていないので、移すものはない。
+        if old_key is not None and old_key != new_key:
+            renames.append((old_key, new_key))
+    return renames
+
+
+def migrate_legacy_keys(store, data_dir='./crawl_exports'):
+    """
+        以前のキーで保存したページ、マニフェストの行、レコードのキャッシュを今のキーに移し、キーが変わった選手の数を返す。
+    """
+    from manifest import CrawlManifest, manifest_path
+    from record_cache import RecordCache, cache_path
+
+    if not os.path.exists(os.path.join(data_dir, 'player_name_draft_year_colleges.csv')):
+        return 0
+    renames = legacy_key_renames(data_dir)
+    store.rename_keys(renames)
+    if os.path.exists(manifest_path):
+        manifest = CrawlManifest(manifest_path)
+        manifest.rename_paths(('{}:{}'.format(kind, old_key), '{}:{}'.format(kind, new_key))
+                              for old_key, new_key in renames for kind in (KIND_COMBINE, KIND_STATS))
+        manifest.close()
+    if os.path.exists(cache_path):
+        record_cache = RecordCache(cache_path)
+        record_cache.rename_keys(renames)
+        record_cache.close()
+    return len(renames)
+
+
+if __name__ == '__main__':
+    page_store = PageStore()
+    print('imported {} players'.format(import_loose_files(page_store)))
+    print('moved {} players to the current page keys'.format(migrate_legacy_keys(page_store)))
+    print(page_store.stats())
+    page_store.close()
@@ -0,0 +1,240 @@
+"""
+-----------------------------------------------------------------------
+-- crawlとscrapeのストリーミングパイプライン ------------------------------
+-----------------------------------------------------------------------
+
+    crawler.pyが全てcrawlし終わってからscraper.pyを実行する代わりに、1つのパイプラインで処理する。
+        1. crawlワーカーが選手ごとにCombineの詳細ページと大学時代の戦績ページをcrawlし、ページストアに保存する。
+        2. 2つのページがそろった選手から、サイズ上限付きのキューに積む。
+           キューがいっぱいの間はcrawlワーカーが待つので、parseが遅くてもメモリは増えない。
+        3. parseワーカーがキューにたまっている選手をまとめて取り、別プロセスでscraper.scrape_batch()を実行する。
+        4. PlayerRecordがbatch_size件たまるごとにoutput.csvに追記する。
+
+    全体の時間はほぼcrawlの時間だけになり、メモリは選手数によらず一定になる。
+    output.csvの行はscrapeが終わった順に並ぶ。
+
+-----------------------------------------------------------------------
+-----------------------------------------------------------------------
+
+
+"""
+
+# Imports
+import argparse
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor
+from functools import partial
+
+import crawler
+import http_session
+import metrics
+from metrics import metrics as run_metrics
+from draft_index import load_or_build_draft_index
+from draft_index import index_path as default_draft_index_path
+from fetcher import Fetcher
+from manifest import CrawlManifest
+from output_writer import append_csv
+from page_store import get_store, KIND_COMBINE, KIND_STATS
+from page_store import store_path as page_store_path
+from player_identity import player_key
+from player_resolver import PlayerResolver
+from scraper import scrape_batch_with_metrics
+
+output_path = 'output.csv'
+default_queue_size = 64
+default_batch_size = 100
+
+# キューの終わりを表す目印
+_done = object()
+
+
+async def run_pipeline(url_list, player_name_list, draft_years, colleges, max_workers=None, parse_workers=None,
+                       queue_size=default_queue_size, batch_size=default_batch_size, output_path=output_path,
+                       manifest=None, store_path=page_store_path, draft_index_path=default_draft_index_path, rates=None):
+    """
+        parameters:
+            url_list, player_name_list, draft_years, colleges: crawler.get_show_urls_and_draft_year()の返り値
+            max_workers: 同時に実行するリクエストの最大数
+            parse_workers: scraper()を実行するプロセス数。NoneはCPUの数。
+            queue_size: crawlが終わってparse待ちになっている選手の最大数
+            batch_size: この件数ごとにoutput.csvに追記する
+        returns:
+            output.csvに書き出した選手の数
+
+        draft_index_pathのドラフトインデックスは、呼び出す前に作っておくこと。
+    """
+    from tqdm import tqdm
+
+    store = get_store(store_path)
+    queue = asyncio.Queue(maxsize=queue_size)
+    players = iter(zip(url_list, player_name_list, draft_years, colleges))
+    written = 0
+    batch = list()
+
+    # 前回の結果に追記しないように消しておく。
+    if os.path.exists(output_path):
+        os.remove(output_path)
+
+    async with Fetcher(max_workers, rates) as fetcher:
+        resolver = PlayerResolver(fetcher, crawler.college_stats_base_url)
+
+        async def crawl_worker(pbar):
+            # 選手の一覧を全てタスクにせず、決まった数のワーカーが順番に取っていく。
+            for url, name, draft_year, college in players:
+                await asyncio.gather(
+                    crawler.crawl_show_page_async(
+                        fetcher, url, name, draft_year, college, manifest, store),
+                    crawler.crawl_college_stats_pages_async(fetcher, name, draft_year, manifest, resolver, college, store))
+                key = player_key(name, draft_year, college)
+                if store.has(KIND_COMBINE, key) and store.has(KIND_STATS, key):
+                    await queue.put((int(draft_year), name, college))
+                else:
+                    # crawlに失敗した選手はparseしない。次のrunでマニフェストから再度crawlされる。
+                    pbar.update(1)
+
+        async def parse_worker(executor, pbar):
+            nonlocal written
+            scrape = partial(scrape_batch_with_metrics, draft_index_path=draft_index_path,
+                             store_path=store_path)
+            finished = False
+            while not finished:
+                # 1人目が来るまで待ち、その時点でキューにたまっている選手もまとめてscrapeする。
+                # 終わりの目印を取ったらそこで止める。(他のparseワーカーの目印は取らない)
+                players = list()
+                item = await queue.get()
+                while True:
+                    if item is _done:
+                        finished = True
+                        break
+                    players.append(item)
+                    if len(players) >= batch_size or queue.empty():
+                        break
+                    item = queue.get_nowait()
+                if not players:
+                    break
+                records = await scrape_players(executor, scrape, players)
+                batch.extend(records)
+                if len(batch) >= batch_size:
+                    append_csv(batch, output_path)
+                    written += len(batch)
+                    batch.clear()
+                pbar.update(len(players))
+
+        async def scrape_players(executor, scrape, players):
+            """
+                playersをまとめてscrapeする。失敗したら1人ずつscrapeし直して、失敗した選手だけを飛ばす。
+                1人ずつに分けるのはscrape_batch()が投げた例外だけで、ワーカープロセスが落ちてプールが壊れた場合
+                (BrokenProcessPool)やプールへの投入の失敗はそのまま投げ、パイプライン全体を止める。
+            """
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(executor, scrape, players)
+            try:
+                records, worker_metrics = await future
+            except BrokenExecutor:
+                # 壊れたプールでは残りの選手も全て失敗するので、1人ずつやり直しても意味がない。
+                raise
+            except Exception as e:
+                if len(players) > 1:
+                    records = list()
+                    for player in players:
+                        records.extend(await scrape_players(executor, scrape, [player]))
+                    return records
+                # 壊れたページの選手は書き出さずに数えておく。次のrunで再度crawlとparseをする。
+                run_metrics.inc('pipeline_scrape_failures_total', error=type(e).__name__)
+                draft_year, name, college = players[0]
+                tqdm.write('failed to scrape {} ({}, {}): {!r}'.format(name, draft_year, college, e))
+                return list()
+            run_metrics.merge(worker_metrics)
+            return records
+
+        # pandas/pyarrowがスレッドを立てた後のプロセスをforkすると終了時に落ちることがあるので、spawnでワーカーを起動する。
+        with ProcessPoolExecutor(max_workers=parse_workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            parse_count = parse_workers or os.cpu_count() or 1
+            with tqdm(total=len(url_list)) as pbar:
+                async def crawl_all():
+                    await asyncio.gather(*[crawl_worker(pbar) for _ in range(fetcher.max_workers)])
+                    for _ in range(parse_count):
+                        await queue.put(_done)
+
+                # crawlとparseを一緒に待ち、どれかが例外で止まったら残りを止める。
+                # (parseワーカーが止まったままだと、crawlワーカーがqueue.put()で待ち続けてしまう)
+                tasks = [asyncio.create_task(crawl_all())] + [asyncio.create_task(parse_worker(executor, pbar))
+                                                              for _ in range(parse_count)]
+                try:
+                    done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+                    for task in done:
+                        if task.exception() is not None:
+                            raise task.exception()
+                finally:
+                    resolver.save()
+                    for task in tasks:
+                        task.cancel()
+                    await asyncio.gather(*tasks, return_exceptions=True)
+
+    if batch:
+        append_csv(batch, output_path)
+        written += len(batch)
+    return written
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Crawl and scrape players in one streaming pass, appending to output.csv as pages arrive.')
+    parser.add_argument('--since', type=int, default=None,
+                        help='only process players drafted in this year or later')
+    parser.add_argument('--max-age-days', type=float, default=None,
+                        help='recrawl pages fetched more than this many days ago')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='maximum number of concurrent requests')
+    parser.add_argument('--parse-workers', type=int, default=None,
+                        help='number of scraper processes (default: number of CPUs)')
+    parser.add_argument('--queue-size', type=int, default=default_queue_size,
+                        help='maximum number of crawled players waiting to be parsed')
+    parser.add_argument('--batch-size', type=int, default=default_batch_size,
+                        help='number of records appended to output.csv at a time')
+    http_session.add_arguments(parser)
+    metrics.add_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def run(args):
+    """
+        コマンドラインの引数に従ってパイプラインを実行する。
+    """
+    # ドラフト巡はparseの途中で必要になるので、先にドラフトページをcrawlしてインデックスを作っておく。
+    with run_metrics.span('draft_page'):
+        crawler.draft_page_crawler()
+        load_or_build_draft_index()
+
+    with run_metrics.span('index'):
+        url_list, player_name_list, draft_years, colleges = crawler.get_show_urls_and_draft_year(
+            crawler.combine_index_url)
+    if args.since is not None:
+        url_list, player_name_list, draft_years, colleges = crawler.filter_since(
+            args.since, url_list, player_name_list, draft_years, colleges)
+
+    manifest = CrawlManifest(max_age_days=args.max_age_days)
+    try:
+        with run_metrics.span('pipeline'):
+            written = asyncio.run(run_pipeline(url_list, player_name_list, draft_years, colleges, args.workers,
+                                               args.parse_workers, args.queue_size, args.batch_size, manifest=manifest))
+    finally:
+        manifest.close()
+    print('Wrote {} players to {}'.format(written, output_path))
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    metrics.configure(args.profile_dir)
+    http_session.configure(args.record, args.replay)
+    try:
+        run(args)
+    finally:
+        if args.metrics is not None:
+            run_metrics.write_report(args.metrics)
+
+
+if __name__ == '__main__':
+    main()
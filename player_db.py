@@ -0,0 +1,284 @@
+"""
+-----------------------------------------------------------------------
+-- Scrape結果の検索 ----------------------------------------------------
+-----------------------------------------------------------------------
+
+    output.csvをSQLiteに読み込み、選手名、大学名、ドラフト年、ドラフト巡、ポジションにインデックスを張って検索する。
+    毎回output.csvをpandasで読み込んで絞り込む代わりに、ミリ秒で答えが返る。
+
+        - load_csv(): output.csvを読み込む。(選手名, ドラフト年, 大学名)が同じ行は上書きするので、何回読み込んでもよい。
+                      前回読み込んだときからファイルが変わっていなければ何もしない。
+        - percentiles(): 絞り込んだ選手の中での、ある記録のパーセンタイル
+        - quantiles(): 絞り込んだ選手の記録の分位点
+        - ranking(): 絞り込んだ選手を記録の良い順に並べる
+
+    40ヤード走などの時間の記録は、小さいほど良い記録としてパーセンタイルと順位を出す。
+
+    使い方:
+        python player_db.py load
+        python player_db.py percentile FortyTime --position WR --round 1
+        python player_db.py quantiles Vertical --since 2015
+        python player_db.py rank BroadJump --year 2020 --limit 10
+
+    ポジションは選手一覧のcsvのPosition列から取る。(シャードごとのcrawlで作られる)
+    Position列がなければ default_position にする。
+
+-----------------------------------------------------------------------
+-----------------------------------------------------------------------
+
+
+"""
+
+# Imports
+import argparse
+import os
+import sqlite3
+import time
+
+from records import columns, dtypes, to_typed_frame
+
+db_path = './crawl_exports/players.sqlite3'
+output_path = 'output.csv'
+name_year_path = './crawl_exports/player_name_draft_year_colleges.csv'
+# crawler.pyのデフォルトの一覧ページはWRだけなので、Position列がなければWRにする。
+default_position = 'WR'
+
+# 小さいほど良い記録
+lower_is_better = {'FortyTime', 'TwentyTime', 'TenTime', 'Shuttle', 'ThreeCone', 'SixtyShuttle'}
+
+table_columns = list(columns.values()) + ['Position']
+metric_columns = [column for column, dtype in dtypes.items()
+                  if dtype not in ('category', 'string') and column not in ('DraftYear', 'DraftRound')]
+
+
+def _sql_type(column):
+    dtype = dtypes.get(column, 'string')
+    if dtype.lower().startswith('int'):
+        return 'INTEGER'
+    if dtype.startswith('float'):
+        return 'REAL'
+    return 'TEXT'
+
+
+class PlayerDB:
+    """
+        parameters:
+            path: SQLiteファイルのパス
+    """
+
+    def __init__(self, path=db_path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS players ({columns});
+            CREATE UNIQUE INDEX IF NOT EXISTS players_key ON players (Player, DraftYear, College);
+            CREATE INDEX IF NOT EXISTS players_college ON players (College);
+            CREATE INDEX IF NOT EXISTS players_year ON players (DraftYear);
+            CREATE INDEX IF NOT EXISTS players_round ON players (DraftRound);
+            CREATE INDEX IF NOT EXISTS players_position ON players (Position, DraftYear);
+            CREATE TABLE IF NOT EXISTS loads (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                rows INTEGER NOT NULL,
+                loaded_at REAL NOT NULL
+            );
+            """.format(columns=', '.join('{} {}'.format(column, _sql_type(column)) for column in table_columns)))
+        self.conn.commit()
+
+    def load_csv(self, csv_path=output_path, names_path=name_year_path, force=False):
+        """
+            output.csvを読み込み、追加・更新した行の数を返す。前回から変わっていなければ0を返す。
+            parameters:
+                names_path: Position列を取る選手一覧のcsv
+                force: Trueの場合はファイルが変わっていなくても読み込む
+        """
+        import pandas as pd
+
+        stat = os.stat(csv_path)
+        source = os.path.abspath(csv_path)
+        loaded = self.conn.execute('SELECT size, mtime FROM loads WHERE path = ?', (source,)).fetchone()
+        if not force and loaded is not None and loaded == (stat.st_size, stat.st_mtime):
+            return 0
+
+        rows = 0
+        # output.csvが大きくてもメモリが一定になるように、少しずつ読み込む。
+        positions = self._read_positions(names_path)
+        for data_df in pd.read_csv(csv_path, chunksize=10000):
+            rows += self.upsert_frame(data_df, positions)
+        self.conn.execute('INSERT OR REPLACE INTO loads (path, size, mtime, rows, loaded_at) VALUES (?, ?, ?, ?, ?)',
+                          (source, stat.st_size, stat.st_mtime, rows, time.time()))
+        self.conn.commit()
+        return rows
+
+    @staticmethod
+    def _read_positions(names_path):
+        """
+            (選手名, ドラフト年, 大学名) → ポジション のdictを返す。
+        """
+        import pandas as pd
+
+        if names_path is None or not os.path.exists(names_path):
+            return dict()
+        names_df = pd.read_csv(names_path)
+        if 'Position' not in names_df.columns:
+            return dict()
+        return {(name, int(year), str(college)): position for name, year, college, position
+                in zip(names_df.Player_Name, names_df.Draft_Year, names_df.College, names_df.Position)}
+
+    def upsert_frame(self, data_df, positions=None):
+        """
+            output.csvと同じ列を持つDataFrameの行を追加・更新し、行の数を返す。
+        """
+        if 'Player' not in data_df.columns:
+            raise ValueError('output.csv has no Player column; re-run scraper.py to regenerate it')
+        positions = positions or dict()
+        typed_df = to_typed_frame(data_df, float_dtype='float64')
+        typed_df['Position'] = [positions.get((player, int(year), str(college)), default_position)
+                                for player, year, college in zip(typed_df.Player, typed_df.DraftYear, typed_df.College)]
+        # 欠損値はNULLにする。
+        values = typed_df[table_columns].astype(object).where(typed_df[table_columns].notna(), None)
+        rows = [tuple(row) for row in values.itertuples(index=False, name=None)]
+        self.conn.executemany('INSERT OR REPLACE INTO players ({}) VALUES ({})'.format(
+            ', '.join(table_columns), ', '.join('?' * len(table_columns))), rows)
+        self.conn.commit()
+        return len(rows)
+
+    @staticmethod
+    def _where(player=None, college=None, year=None, since=None, until=None, draft_round=None, position=None):
+        conditions, parameters = list(), list()
+        for column, operator, value in [('Player', '=', player), ('College', '=', college),
+                                        ('DraftYear', '=', year), ('DraftYear', '>=', since),
+                                        ('DraftYear', '<=', until), ('DraftRound', '=', draft_round),
+                                        ('Position', '=', position)]:
+            if value is not None:
+                conditions.append('{} {} ?'.format(column, operator))
+                parameters.append(value)
+        return ('WHERE ' + ' AND '.join(conditions)) if conditions else '', parameters
+
+    @staticmethod
+    def _check_metric(metric):
+        # 列名はSQLに埋め込むので、知っている列だけを受け付ける。
+        if metric not in metric_columns:
+            raise ValueError('unknown metric: {} (choose from {})'.format(metric, ', '.join(metric_columns)))
+
+    def percentiles(self, metric, **filters):
+        """
+            絞り込んだ選手の中での、metricのパーセンタイル(0〜100、大きいほど良い記録)を返す。
+            returns:
+                [(選手名, ドラフト年, 大学名, 記録, パーセンタイル), ...] 良い記録の順
+            filters:
+                player, college, year, since, until, draft_round, position
+        """
+        self._check_metric(metric)
+        # 選手名での絞り込みは、他の選手と比べたパーセンタイルを出してから行う。
+        player = filters.pop('player', None)
+        where, parameters = self._where(**filters)
+        where = (where + ' AND ' if where else 'WHERE ') + '{} IS NOT NULL'.format(metric)
+        order = 'DESC' if metric in lower_is_better else 'ASC'
+        query = ('SELECT Player, DraftYear, College, {metric}, 100.0 * PERCENT_RANK() OVER (ORDER BY {metric} {order}) '
+                 'AS percentile FROM players {where}').format(metric=metric, order=order, where=where)
+        if player is not None:
+            query = 'SELECT * FROM ({}) WHERE Player = ?'.format(query)
+            parameters.append(player)
+        return self.conn.execute(query + ' ORDER BY percentile DESC', parameters).fetchall()
+
+    def quantiles(self, metric, qs=(0.1, 0.25, 0.5, 0.75, 0.9), **filters):
+        """
+            絞り込んだ選手のmetricの分位点を {q: 値} のdictで返す。(線形補間)
+        """
+        self._check_metric(metric)
+        where, parameters = self._where(**filters)
+        where = (where + ' AND ' if where else 'WHERE ') + '{} IS NOT NULL'.format(metric)
+        values = [row[0] for row in self.conn.execute(
+            'SELECT {metric} FROM players {where} ORDER BY {metric}'.format(metric=metric, where=where), parameters)]
+        result = dict()
+        for q in qs:
+            if not values:
+                result[q] = None
+                continue
+            position = (len(values) - 1) * q
+            lower = int(position)
+            upper = min(lower + 1, len(values) - 1)
+            result[q] = values[lower] + (values[upper] - values[lower]) * (position - lower)
+        return result
+
+    def ranking(self, metric, limit=10, **filters):
+        """
+            絞り込んだ選手をmetricの良い順に並べ、[(順位, 選手名, ドラフト年, 大学名, 記録), ...] を返す。
+        """
+        self._check_metric(metric)
+        where, parameters = self._where(**filters)
+        where = (where + ' AND ' if where else 'WHERE ') + '{} IS NOT NULL'.format(metric)
+        order = 'ASC' if metric in lower_is_better else 'DESC'
+        query = ('SELECT RANK() OVER (ORDER BY {metric} {order}), Player, DraftYear, College, {metric} '
+                 'FROM players {where} ORDER BY {metric} {order} LIMIT ?').format(metric=metric, order=order, where=where)
+        return self.conn.execute(query, parameters + [limit]).fetchall()
+
+    def count(self):
+        return self.conn.execute('SELECT COUNT(*) FROM players').fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Query scraped combine results and college stats.')
+    parser.add_argument('--db', default=db_path, help='path of the SQLite database')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    load = subparsers.add_parser('load', help='load output.csv into the database')
+    load.add_argument('--csv', default=output_path)
+    load.add_argument('--names', default=name_year_path,
+                      help='player list with a Position column')
+    load.add_argument('--force', action='store_true',
+                      help='reload even if the csv has not changed')
+
+    for name, help_text in [('percentile', 'percentile of each player within the filtered group'),
+                            ('quantiles', 'quantiles of a metric within the filtered group'),
+                            ('rank', 'players ranked by a metric, best first')]:
+        query = subparsers.add_parser(name, help=help_text)
+        query.add_argument('metric', choices=metric_columns)
+        query.add_argument('--player', default=None)
+        query.add_argument('--college', default=None)
+        query.add_argument('--year', type=int, default=None)
+        query.add_argument('--since', type=int, default=None)
+        query.add_argument('--until', type=int, default=None)
+        query.add_argument('--round', dest='draft_round', type=int, default=None)
+        query.add_argument('--position', default=None)
+        if name == 'rank':
+            query.add_argument('--limit', type=int, default=10)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    player_db = PlayerDB(args.db)
+    try:
+        if args.command == 'load':
+            print('loaded {} rows ({} players in {})'.format(
+                player_db.load_csv(args.csv, args.names, args.force), player_db.count(), args.db))
+            return
+
+        filters = {'college': args.college, 'year': args.year, 'since': args.since, 'until': args.until,
+                   'draft_round': args.draft_round, 'position': args.position}
+        start = time.perf_counter()
+        if args.command == 'percentile':
+            for player, year, college, value, percentile in player_db.percentiles(args.metric, player=args.player, **filters):
+                print('{:5.1f}  {:<28} {} {:<20} {}'.format(percentile, player, year, college, value))
+        elif args.command == 'quantiles':
+            for q, value in player_db.quantiles(args.metric, player=args.player, **filters).items():
+                print('p{:<3} {}'.format(int(q * 100), value))
+        else:
+            for rank, player, year, college, value in player_db.ranking(args.metric, args.limit, player=args.player, **filters):
+                print('{:>4}  {:<28} {} {:<20} {}'.format(rank, player, year, college, value))
+        print('({:.1f} ms)'.format((time.perf_counter() - start) * 1000))
+    finally:
+        player_db.close()
+
+
+if __name__ == '__main__':
+    main()
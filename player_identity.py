@@ -0,0 +1,140 @@
+"""
+-----------------------------------------------------------------------
+-- 選手の識別 ----------------------------------------------------------
+-----------------------------------------------------------------------
+
+    選手名・ドラフト年・大学名の正規化と、そこから作るキーをまとめたモジュール。
+    crawler、scraper、page_store、player_resolver、draft_indexは全てここを通して選手を識別する。
+
+        選手名:   小文字にし、'.'と','、末尾のJr/Sr/II/IIIなどを取り除く
+                      "Odell Beckham Jr." -> "odell beckham"
+        slug:     正規化した選手名の全ての部分を'-'でつなぐ。選手の識別に使う
+                      "Equanimeous St. Brown" -> "equanimeous-st-brown"
+                      "Henry Ruggs III" -> "henry-ruggs"
+        URLのslug: sports-referenceの選手ページのURLに使われる形。slugと違い、接尾辞を残す
+                      "Henry Ruggs III" -> "henry-ruggs-iii" (henry-ruggs-iii-1.html)
+        大学名:   小文字の英数字だけにする
+        キー:     ページストアのキー "{slug}|{ドラフト年}|{大学名}"
+
+    slugでは "'" も取り除くので、以前の "{名前の最初の2語}|{ドラフト年}|{大学名}" のキーとは
+    "Ja'Marr Chase" ("ja'marr-chase" -> "jamarr-chase")、"D.J. Moore" ("d.j.-moore" -> "dj-moore") や
+    3語以上の名前でキーが変わる。それより前に作ったページストア、マニフェスト、レコードのキャッシュは
+        python page_store.py
+    で新しいキーに移すこと。(移さない場合、その選手はもう一度crawlされる)
+
+    同じ選手は何度も(crawl、scrape、ドラフトインデックスのlookupで)出てくるので、正規化の結果はメモ化しておく。
+
+-----------------------------------------------------------------------
+-----------------------------------------------------------------------
+
+
+"""
+
+# Imports
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+
+name_suffixes = {'jr', 'sr', 'ii', 'iii', 'iv', 'v'}
+# slugに残さない文字 ("D'Wayne" -> "dwayne")
+slug_removed_pattern = re.compile(r'[^a-z0-9-]')
+
+
+@lru_cache(maxsize=None)
+def _words(name):
+    return tuple(str(name).lower().replace('.', '').replace(',', ' ').split())
+
+
+@lru_cache(maxsize=None)
+def _name_words(name):
+    words = list(_words(name))
+    # "Smith Jr"のように2語しかない場合は、接尾辞ではなく名字として残す。
+    while len(words) > 2 and words[-1] in name_suffixes:
+        words.pop()
+    return tuple(words)
+
+
+def _join_slug(words):
+    return '-'.join(slug_removed_pattern.sub('', word) for word in words)
+
+
+def normalize_name(name):
+    """
+        小文字にし、'.'と','、Jr/Sr/II/IIIなどの接尾辞を取り除いた選手名を返す。
+    """
+    return ' '.join(_name_words(name))
+
+
+@lru_cache(maxsize=None)
+def name_slug(name):
+    """
+        選手の識別に使う "{first_name}-{last_name}" の形を返す。3語以上の名前は全ての語をつなぎ、Jr/IIIなどの接尾辞は取り除く。
+    """
+    return _join_slug(_name_words(name))
+
+
+@lru_cache(maxsize=None)
+def url_slug(name):
+    """
+        sports-referenceの選手ページのURLに使われる形を返す。name_slug()と違い、Jr/IIIなどの接尾辞も残す。
+            "Henry Ruggs III" -> "henry-ruggs-iii"
+    """
+    return _join_slug(_words(name))
+
+
+@lru_cache(maxsize=None)
+def normalize_college(college):
+    return ''.join(ch for ch in str(college or '').lower() if ch.isalnum())
+
+
+@dataclass(frozen=True)
+class PlayerIdentity:
+    """
+        1人の選手の識別情報。player_identity()で作ること。
+    """
+    __slots__ = ('name', 'draft_year', 'college', 'normalized_name', 'slug', 'normalized_college', 'key')
+
+    name: str
+    draft_year: int
+    college: str
+    normalized_name: str
+    slug: str
+    normalized_college: str
+    # ページストアのキー
+    key: str
+
+
+@lru_cache(maxsize=None)
+def player_identity(name, draft_year, college):
+    """
+        parameters:
+            name: 選手名
+            draft_year: ドラフト年(intでも文字列でもよい)
+            college: 大学名
+        returns:
+            PlayerIdentity。同じ引数には同じオブジェクトを返す。
+    """
+    draft_year = int(draft_year)
+    slug, normalized_college = name_slug(name), normalize_college(college)
+    return PlayerIdentity(name, draft_year, college, normalize_name(name), slug, normalized_college,
+                          '{}|{}|{}'.format(slug, draft_year, normalized_college))
+
+
+def player_key(name, draft_year, college):
+    """
+        選手名、ドラフト年、大学名からページストアのキーを作る。
+    """
+    return player_identity(name, draft_year, college).key
+
+
+def legacy_player_key(name, draft_year, college):
+    """
+        以前のページストアのキー。名前の最初の2語をそのまま(小文字にするだけで)つないでいた。
+        page_store.migrate_legacy_keys()で古いキーを移すときにだけ使う。
+        以前のコードは1語の名前ではキーを作れずに落ちていたので、その場合はNoneを返す。
+    """
+    words = str(name).split()
+    if len(words) < 2:
+        return None
+    normalized_college = ''.join(ch for ch in str(college).lower() if ch.isalnum())
+    return '{}-{}|{}|{}'.format(words[0].lower(), words[1].lower(), int(draft_year), normalized_college)
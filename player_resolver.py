@@ -0,0 +1,236 @@
+"""
+-----------------------------------------------------------------------
+-- 選手ページの解決 ----------------------------------------------------
+-----------------------------------------------------------------------
+
+    sports-referenceの選手ページは "{first_name}-{last_name}-{番号}.html" というURLで、
+    同姓同名の選手は番号で区別される。URLにはJr/IIIなどの接尾辞も入る。(player_identity.url_slug)
+    一度調べた候補ページ(URL、大学名、最後のシーズン)は名前ごとにインデックスとしてSQLiteに保存し、
+    次のrun以降は1回のlookupでどのページを使えばいいかが決まるようにする。
+
+    インデックスのテーブル(players):
+        slug:       "{first_name}-{last_name}" (player_identity.url_slug)
+        candidates: [{"url": ..., "school": ..., "last_season": ...}, ...] のJSON
+        next:       次に調べる番号
+        complete:   404まで調べ終わっていれば1
+
+    save()はこのrunで変わった名前だけを、保存済みの行とマージして書く。
+    (候補はURLで合わせ、nextは大きい方を使う) --workerで複数のプロセスが同時に保存しても、他のプロセスが調べた候補は消えない。
+
+    インデックスの候補のページが404を返すようになった場合は、forget()でその名前のエントリーを捨てて1番から調べ直す。
+    捨てた名前は保存済みの行とマージせずに上書きする。
+
+-----------------------------------------------------------------------
+-----------------------------------------------------------------------
+
+
+"""
+
+# Imports
+import asyncio
+import json
+import os
+import re
+import sqlite3
+from collections import defaultdict
+
+from metrics import metrics
+from player_identity import normalize_college, url_slug
+
+index_path = './crawl_exports/player_index.sqlite3'
+
+tbody_pattern = re.compile(r'<tbody[^>]*>(.*?)</tbody>', re.S)
+row_pattern = re.compile(r'<tr[^>]*>(.*?)</tr>', re.S)
+th_pattern = re.compile(r'<th[^>]*>(.*?)</th>', re.S)
+school_pattern = re.compile(
+    r'<td[^>]*data-stat="school_name"[^>]*>(.*?)</td>', re.S)
+tag_pattern = re.compile(r'<[^>]+>')
+
+
+def read_page_summary(text):
+    """
+        戦績ページから最後のシーズンと大学名だけを正規表現で取り出す。
+        BeautifulSoupで全体をparseしないので速い。
+        returns:
+            (<int>last_season, <str>school) 見つからなければ (0, None)
+    """
+    tbody = tbody_pattern.search(text)
+    if tbody is None:
+        return 0, None
+    rows = row_pattern.findall(tbody.group(1))
+    if not rows:
+        return 0, None
+    last_row = rows[-1]
+    th = th_pattern.search(last_row)
+    season = ''.join(
+        [num for num in tag_pattern.sub('', th.group(1)) if num.isdecimal()]) if th else ''
+    school = school_pattern.search(last_row)
+    school = tag_pattern.sub('', school.group(1)).strip() if school else None
+    return (int(season) if season else 0), school
+
+
+class PlayerResolver:
+    """
+        parameters:
+            fetcher: fetcher.Fetcher
+            base_url: 選手ページのベースURL
+            path: インデックスを保存するSQLiteファイルのパス。Noneの場合は保存しない。
+
+        resolve()は (url, page) を返す。
+        pageはこのrunでfetchした本文で、インデックスのキャッシュから解決した場合はNone。
+    """
+
+    def __init__(self, fetcher, base_url, path=index_path):
+        self.fetcher = fetcher
+        self.base_url = base_url
+        self.path = path
+        self.index = dict()
+        # このrunで変わった名前。save()で保存する。
+        self._dirty = set()
+        # forget()で捨てた名前。save()で保存済みの行とマージしない。
+        self._forgotten = set()
+        # 同姓同名の選手が同時に同じ番号を調べないように、名前ごとにロックをかける。
+        self._locks = defaultdict(asyncio.Lock)
+        # このrunでfetchしたページの本文。呼び出し元に渡したら捨てる。
+        self._pages = dict()
+        self.conn = None
+        if path is not None:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.conn = sqlite3.connect(path, timeout=60)
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS players (
+                    slug TEXT PRIMARY KEY,
+                    candidates TEXT NOT NULL,
+                    next INTEGER NOT NULL,
+                    complete INTEGER NOT NULL
+                )""")
+            self.conn.commit()
+
+    def _load(self, key):
+        row = self.conn.execute('SELECT candidates, next, complete FROM players WHERE slug = ?',
+                                (key,)).fetchone()
+        if row is None:
+            return None
+        return {'candidates': json.loads(row[0]), 'next': row[1], 'complete': bool(row[2])}
+
+    def _entry(self, key):
+        # 名前ごとに、初めて使うときにだけインデックスから読む。
+        if key not in self.index:
+            entry = self._load(key) if self.conn is not None else None
+            self.index[key] = entry or {'candidates': [], 'next': 1, 'complete': False}
+        return self.index[key]
+
+    async def _probe_next(self, key):
+        """
+            まだ調べていない次の番号のページをfetchして候補に加える。
+            404が返ってきたら候補を全て調べ終えたとする。
+        """
+        entry = self._entry(key)
+        url = self.base_url + "{}-{}.html".format(key, entry['next'])
+        metrics.inc('resolver_probes_total')
+        page = await self.fetcher.fetch(url)
+        self._dirty.add(key)
+        if page.status_code == 404 or "404 error" in page.text:
+            entry['complete'] = True
+            return None
+        # 404以外のエラーはページとして扱わず、呼び出し元にrequests.HTTPErrorを投げる。
+        page.raise_for_status()
+        last_season, school = read_page_summary(page.text)
+        candidate = {'url': url, 'school': school, 'last_season': last_season}
+        entry['candidates'].append(candidate)
+        entry['next'] += 1
+        self._pages[url] = page
+        return candidate
+
+    @staticmethod
+    def _matches(candidate, draft_year):
+        # ドラフト年-1の年(求める人であれば戦績のテーブルに必ず入っている)が最後のシーズン
+        return candidate['last_season'] == int(draft_year) - 1
+
+    def _pick(self, candidates, college):
+        if len(candidates) > 1 and college:
+            same_school = [candidate for candidate in candidates
+                           if normalize_college(candidate['school']) == normalize_college(college)]
+            if same_school:
+                return same_school[0]
+        return candidates[0] if candidates else None
+
+    async def resolve(self, name, draft_year, college=None):
+        """
+            parameters:
+                name: 選手名
+                draft_year: ドラフト年
+                college: 大学名。同じ年に同姓同名の選手がいた場合に使う。
+            returns:
+                (url, page) 見つからなかった場合は (None, None)
+        """
+        key = url_slug(name)
+        probes = 0
+        async with self._locks[key]:
+            entry = self._entry(key)
+            matched = [candidate for candidate in entry['candidates']
+                       if self._matches(candidate, draft_year)]
+
+            # 前回404まで調べ終わっていても、その後に同姓同名の新しい選手のページができている場合があるので、
+            # 見つからなかったときは次の番号をもう一度だけ調べる。
+            if not matched:
+                entry['complete'] = False
+            # まだ全ての候補を調べていなければ、見つかるまで次の番号を調べる。
+            while not matched and not entry['complete']:
+                candidate = await self._probe_next(key)
+                probes += 1
+                if candidate is not None and self._matches(candidate, draft_year):
+                    matched.append(candidate)
+
+        # インデックスだけで解決できた選手は0回になる。
+        metrics.observe('resolver_probes_per_player', probes)
+        candidate = self._pick(matched, college)
+        if candidate is None:
+            return None, None
+        return candidate['url'], self._pages.pop(candidate['url'], None)
+
+    def forget(self, name):
+        """
+            インデックスの候補のページが404になったときに呼ぶ。その名前のエントリーを捨て、次のresolve()で1番から調べ直す。
+        """
+        key = url_slug(name)
+        metrics.inc('resolver_stale_candidates_total')
+        self.index[key] = {'candidates': [], 'next': 1, 'complete': False}
+        self._dirty.add(key)
+        self._forgotten.add(key)
+
+    @staticmethod
+    def _merge(entry, saved):
+        """
+            このrunのエントリーと、他のプロセスが先に保存したエントリーをマージする。
+        """
+        if saved is None:
+            return entry
+        candidates = list(saved['candidates'])
+        urls = {candidate['url'] for candidate in candidates}
+        candidates += [candidate for candidate in entry['candidates'] if candidate['url'] not in urls]
+        # 先まで調べた方のcompleteを使う。
+        latest = entry if entry['next'] >= saved['next'] else saved
+        return {'candidates': candidates, 'next': latest['next'], 'complete': latest['complete']}
+
+    def save(self):
+        """
+            このrunで変わった名前を、保存済みの行とマージして1つのトランザクションで書く。
+        """
+        if self.conn is None or not self._dirty:
+            return
+        with self.conn:
+            # 読んでから書くまでの間に他のプロセスが書かないように、最初に書き込みのロックを取る。
+            self.conn.execute('BEGIN IMMEDIATE')
+            for key in sorted(self._dirty):
+                saved = None if key in self._forgotten else self._load(key)
+                entry = self._merge(self.index[key], saved)
+                self.index[key] = entry
+                self.conn.execute(
+                    'INSERT OR REPLACE INTO players (slug, candidates, next, complete) VALUES (?, ?, ?, ?)',
+                    (key, json.dumps(entry['candidates']), entry['next'], int(entry['complete'])))
+        self._dirty.clear()
+        self._forgotten.clear()
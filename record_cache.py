@@ -0,0 +1,105 @@
+"""
+-----------------------------------------------------------------------
+-- parse済みレコードのキャッシュ -------------------------------------------
+-----------------------------------------------------------------------
+
+    scraperがparseしたPlayerRecordを、元のページの本文のsha256(ページストアのハッシュ)と一緒にSQLiteに保存する。
+    次のrunでは、Combineのページと戦績のページのハッシュがどちらも保存したときと同じならparseせずにキャッシュを使う。
+    crawlでページが更新された選手だけがparseし直されるので、毎晩の更新の時間はアーカイブの大きさではなく変わったページの数で決まる。
+
+    ドラフト巡はドラフトインデックスが更新されると変わるので、キャッシュには戦績ページの#metaから読んだドラフト巡を保存し、
+    インデックスはrunごとに引き直す。
+
+    parseの処理やPlayerRecordの項目を変えたときは cache_version を上げること。古いバージョンのレコードは使われない。
+
+-----------------------------------------------------------------------
+-----------------------------------------------------------------------
+
+
+"""
+
+# Imports
+import json
+import os
+import sqlite3
+from dataclasses import asdict
+
+from metrics import metrics
+from records import PlayerRecord
+
+cache_path = './crawl_exports/record_cache.sqlite3'
+cache_version = 2
+
+
+class RecordCache:
+    """
+        parameters:
+            path: SQLiteファイルのパス
+    """
+
+    def __init__(self, path=cache_path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=60)
+        # scraperの複数のワーカープロセスから同時に読み書きするのでWALにする。
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS records (
+                key TEXT PRIMARY KEY,
+                combine_hash TEXT,
+                stats_hash TEXT,
+                version INTEGER NOT NULL,
+                record TEXT NOT NULL
+            )""")
+        self.conn.commit()
+
+    def get(self, key, combine_hash, stats_hash):
+        """
+            ページのハッシュが保存したときと同じならPlayerRecordを返す。ページが変わっていればNone。
+        """
+        row = self.conn.execute('SELECT combine_hash, stats_hash, version, record FROM records WHERE key = ?',
+                                (key,)).fetchone()
+        if row is None or row[:3] != (combine_hash, stats_hash, cache_version):
+            metrics.inc('record_cache_misses_total')
+            return None
+        metrics.inc('record_cache_hits_total')
+        return PlayerRecord(**json.loads(row[3]))
+
+    def put_many(self, entries):
+        """
+            parameters:
+                entries: (key, combine_hash, stats_hash, PlayerRecord) の配列。1つのトランザクションで保存する。
+        """
+        with self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO records (key, combine_hash, stats_hash, version, record) VALUES (?, ?, ?, ?, ?)',
+                [(key, combine_hash, stats_hash, cache_version, json.dumps(asdict(record)))
+                 for key, combine_hash, stats_hash, record in entries])
+
+    def rename_keys(self, renames):
+        """
+            parameters:
+                renames: (古いキー, 新しいキー) の配列。レコードはページのハッシュで確かめるので、キーだけを付け替えてよい。
+        """
+        with self.conn:
+            for old_key, new_key in renames:
+                self.conn.execute('UPDATE OR IGNORE records SET key = ? WHERE key = ?', (new_key, old_key))
+                self.conn.execute('DELETE FROM records WHERE key = ?', (old_key,))
+
+    def close(self):
+        self.conn.close()
+
+
+_process_cache = None
+
+
+def get_cache(path=cache_path):
+    """
+        プロセスごとに1つだけRecordCacheを開いて返す。scraperのワーカープロセスから使う。
+    """
+    global _process_cache
+    if _process_cache is None or _process_cache.path != path:
+        _process_cache = RecordCache(path)
+    return _process_cache
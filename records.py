@@ -0,0 +1,171 @@
+"""
+-----------------------------------------------------------------------
+-- Scrapeした選手1人分のレコード -----------------------------------------
+-----------------------------------------------------------------------
+
+    scraper.scraper()は選手1人につきPlayerRecordを1つ返す。
+    値が取れなかった項目はデフォルト値のままになるので、1つの項目が欠けても他の列がずれることはない。
+    output.csvの列の並びと列名は columns で決める。
+    Parquetに書き出すときの列の型は dtypes で決める。
+
+-----------------------------------------------------------------------
+-----------------------------------------------------------------------
+
+
+"""
+
+# Imports
+from dataclasses import dataclass
+from typing import Optional, Union
+
+# 戦績ページから取った値はget_text()の文字列のまま、テーブルがなければ0が入る。
+# テーブルはあっても値の行がなければNone(欠損値)になる。
+StatText = Union[str, int, None]
+
+
+@dataclass
+class PlayerRecord:
+    # Combineの結果(記録されていなければNone)
+    height: Optional[float] = None
+    weight: Optional[float] = None
+    hand_size: Optional[float] = None
+    arm_length: Optional[float] = None
+    forty_time: Optional[float] = None
+    twenty_time: Optional[float] = None
+    ten_time: Optional[float] = None
+    bench: Optional[int] = None
+    vertical: Optional[float] = None
+    broad_jump: Optional[float] = None
+    shuttle: Optional[float] = None
+    three_cone: Optional[float] = None
+    sixty_shuttle: Optional[float] = None
+    # 大学時代の戦績
+    last_year_rec_avg: StatText = 0
+    career_rec_avg: StatText = 0
+    last_year_return_avg: StatText = 0
+    career_return_avg: StatText = 0
+    draft_round: StatText = 0
+    college: Optional[str] = None
+    draft_year: Optional[int] = None
+    career_rec: StatText = 0
+    last_year_rec: StatText = 0
+    # コメントで覆われたテーブル(punt_ret, rushing, defense)から取った戦績
+    last_year_punt_return_avg: StatText = 0
+    career_punt_return_avg: StatText = 0
+    last_year_rush_yds: StatText = 0
+    career_rush_yds: StatText = 0
+    last_year_rush_avg: StatText = 0
+    career_rush_avg: StatText = 0
+    last_year_tackles: StatText = 0
+    career_tackles: StatText = 0
+    player: Optional[str] = None
+
+
+# PlayerRecordの属性名とoutput.csvの列名の対応。並びがそのまま列の並びになる。
+columns = {
+    'height': 'Height',
+    'weight': 'Weight',
+    'hand_size': 'HandSize',
+    'arm_length': 'ArmLength',
+    'forty_time': 'FortyTime',
+    'twenty_time': 'TwentyTime',
+    'ten_time': 'TenTime',
+    'bench': 'Bench',
+    'vertical': 'Vertical',
+    'broad_jump': 'BroadJump',
+    'shuttle': 'Shuttle',
+    'three_cone': 'ThreeCone',
+    'sixty_shuttle': 'SixtyShuttle',
+    'last_year_rec_avg': 'LastYearRecAvg',
+    'career_rec_avg': 'CareerRecAvg',
+    'last_year_return_avg': 'LastYearReturnAvg',
+    'career_return_avg': 'CareerReturnAvg',
+    'draft_round': 'DraftRound',
+    'college': 'College',
+    'draft_year': 'DraftYear',
+    'career_rec': 'CareerRec',
+    'last_year_rec': 'LastYearRec',
+    'last_year_punt_return_avg': 'LastYearPuntReturnAvg',
+    'career_punt_return_avg': 'CareerPuntReturnAvg',
+    'last_year_rush_yds': 'LastYearRushYds',
+    'career_rush_yds': 'CareerRushYds',
+    'last_year_rush_avg': 'LastYearRushAvg',
+    'career_rush_avg': 'CareerRushAvg',
+    'last_year_tackles': 'LastYearTackles',
+    'career_tackles': 'CareerTackles',
+    'player': 'Player',
+}
+
+# Combineの結果の列。欠損値が混ざるとpandasが浮動小数点にするので、追記するときも浮動小数点に揃える。
+measurement_columns = ['Height', 'Weight', 'HandSize', 'ArmLength', 'FortyTime', 'TwentyTime', 'TenTime',
+                       'Bench', 'Vertical', 'BroadJump', 'Shuttle', 'ThreeCone', 'SixtyShuttle']
+
+
+def records_to_dict(records):
+    """
+        PlayerRecordの配列を、output.csvの列名をキーとした列ごとの配列のdictに変換する。
+    """
+    return {column: [getattr(record, name) for record in records] for name, column in columns.items()}
+
+
+# 列ごとの型。値の文字列は数値に変換し、変換できないものは欠損値にする。
+# Int16はpandasの欠損値を扱える整数型。DraftYearは欠けることがないのでnumpyのint16にしておく。
+dtypes = {
+    'Height': 'float32',
+    'Weight': 'float32',
+    'HandSize': 'float32',
+    'ArmLength': 'float32',
+    'FortyTime': 'float32',
+    'TwentyTime': 'float32',
+    'TenTime': 'float32',
+    'Bench': 'Int16',
+    'Vertical': 'float32',
+    'BroadJump': 'float32',
+    'Shuttle': 'float32',
+    'ThreeCone': 'float32',
+    'SixtyShuttle': 'float32',
+    'LastYearRecAvg': 'float32',
+    'CareerRecAvg': 'float32',
+    'LastYearReturnAvg': 'float32',
+    'CareerReturnAvg': 'float32',
+    'DraftRound': 'Int16',
+    'College': 'category',
+    'DraftYear': 'int16',
+    'CareerRec': 'Int16',
+    'LastYearRec': 'Int16',
+    'LastYearPuntReturnAvg': 'float32',
+    'CareerPuntReturnAvg': 'float32',
+    'LastYearRushYds': 'Int16',
+    'CareerRushYds': 'Int16',
+    'LastYearRushAvg': 'float32',
+    'CareerRushAvg': 'float32',
+    'LastYearTackles': 'Int16',
+    'CareerTackles': 'Int16',
+    'Player': 'string',
+}
+
+
+def to_typed_frame(data_df, float_dtype=None):
+    """
+        output.csvと同じ列を持つDataFrameを、dtypesの型に揃えたDataFrameに変換する。
+        float_dtypeを渡した場合は、浮動小数点の列をその型にする。(float32の丸め誤差を避けたいときに'float64'を渡す)
+    """
+    import pandas as pd
+
+    typed = dict()
+    for column, dtype in dtypes.items():
+        values = data_df[column]
+        if dtype == 'category':
+            typed[column] = values.astype('string').astype('category')
+        elif dtype == 'string':
+            typed[column] = values.astype('string')
+        else:
+            # '1,234'のような桁区切りの入った文字列も数値にする。
+            values = pd.to_numeric(values.astype('string').str.replace(',', '', regex=False),
+                                   errors='coerce')
+            if dtype.startswith('Int'):
+                values = values.round()
+            elif dtype.startswith('float') and float_dtype is not None:
+                dtype = float_dtype
+            typed[column] = values.astype(dtype)
+    return pd.DataFrame(typed)
@@ -25,6 +25,11 @@
     - 60yds Shuttle (seconds) 60ヤードのシャトル走
     - Career receiving yards レシービングヤード数（大学時代全て）
     - Last Year receiving yards レシービングヤード数（大学最後の年のみ）
+    -- コメントで覆われたテーブルから --
+    - Career/Last year punt return yards per return １パントリターンあたりのヤード数
+    - Career/Last year rushing yards ラッシングヤード数
+    - Career/Last year rushing yards per attempt １キャリーあたりのラッシングヤード数
+    - Career/Last year total tackles タックル数
 -----------------------------------------------------------------------
 -----------------------------------------------------------------------
 
@@ -32,36 +37,40 @@
 """
 
 # imports
-import requests
-from bs4 import BeautifulSoup as bs
-from bs4 import Comment
+import argparse
+import multiprocessing
 import os
-import pandas as pd
-from tqdm import tqdm
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import metrics
+from metrics import metrics as run_metrics
+from page_parser import parse_combine_page, parse_stats_page
+from combine_fields import convert_values, raw_values
+from records import PlayerRecord
+from output_writer import ChunkedWriter, default_chunk_size, input_fingerprint
+from page_store import get_store, KIND_COMBINE, KIND_STATS
+from page_store import store_path as page_store_path
+from player_identity import player_key
+from record_cache import get_cache
+from record_cache import cache_path as record_cache_path
+from draft_index import get_draft_index, load_or_build_draft_index, round_from_meta
+from draft_index import index_path as default_draft_index_path
 
 name_year_path = './crawl_exports/player_name_draft_year_colleges.csv'
 
-# global variables
-heights = list()
-weights = list()
-hand_sizes = list()
-arm_lengths = list()
-forty_times = list()
-twenty_times = list()
-ten_times = list()
-benches = list()
-verticals = list()
-broads = list()
-shuttles = list()
-three_cones = list()
-sixty_yard_shuttles = list()
-last_year_rec = list()
-career_rec = list()
-last_year_return = list()
-career_return = list()
-draft_round = list()
-total_career_rec = list()
-total_last_year_rec = list()
+# 戦績のテーブルから取る値: (テーブルのid, 'td'の位置, 最後の年の属性名, 通算の属性名)
+# テーブルがない選手は0のままにする。テーブルはあってもtbodyやtfoot、その位置の'td'がなければNone(欠損値)にする。
+table_stats = [
+    ('receiving', 7, 'last_year_rec_avg', 'career_rec_avg'),
+    ('receiving', 6, 'last_year_rec', 'career_rec'),
+    # returning yards はコメントに覆われているので、page_parserでコメントの中から取り出している。
+    ('kick_ret', 7, 'last_year_return_avg', 'career_return_avg'),
+    # 以下もコメントで覆われたテーブル
+    ('punt_ret', 7, 'last_year_punt_return_avg', 'career_punt_return_avg'),
+    ('rushing', 6, 'last_year_rush_yds', 'career_rush_yds'),
+    ('rushing', 7, 'last_year_rush_avg', 'career_rush_avg'),
+    ('defense', 7, 'last_year_tackles', 'career_tackles'),
+]
 
 
 def read_name_year_college():
@@ -74,270 +83,221 @@ def read_name_year_college():
     crawler.pyで書き出した選手名とドラフト年を含むcsvファイルを読み込んで、それぞれの列を配列として返す
     """
 
+    import pandas as pd
+
     name_year_df = pd.read_csv(name_year_path)
 
     return list(name_year_df.Draft_Year), list(name_year_df.Player_Name), list(name_year_df.College)
 
 
-def scraper(draft_year, player_name, recent_player_names, recent_draft_round):
+def scrape_college_stats(store, key, draft_year, player_name, college):
     """
-    for文を多用したくないため、二つのページから同時にスクレーピングを行う。
-    返す値はなく、グローバルで定義されている配列にスクレーピングした値を保存する。
+    大学時代の戦績ページから、Combine以外の項目を埋めたPlayerRecordを返す。
+    ドラフト巡には戦績ページの#metaから読んだ値が入る。ドラフトインデックスはscrape_batch()で引く。
+    crawlに失敗してページストアにページがない選手は、戦績の項目を全てNone(欠損値)にする。
     """
-    first_name = player_name.split()[0]
-    last_name = player_name.split()[1]
-
-    ####### combine stats #######
-    combine_file_name = '{}_{}_{}.html'.format(
-        first_name, last_name, draft_year)
-    combine_base_path = 'crawl_exports/combine_results/'
-    combine_file_path = os.path.join(combine_base_path, combine_file_name)
-    combine_content = open(combine_file_path, 'r').read()
-    combine_stat_soup = bs(combine_content, 'html.parser')
-    stats = combine_stat_soup.select_one(
-        "table[class='tableperc']").select('tr')
-
-    for idx, stat in enumerate(stats):
-        """
-        idx==1: 選手の身長
-        idx==2: 選手の体重
-        idx==3: 選手の手の大きさ
-        idx==4: 選手の腕の長さ
-        idx==5: 選手の40yd走の記録
-        idx==6: 選手の20yd走の記録
-        idx==7: 選手の10yd走の記録
-        idx==8: 選手の100kgのベンチプレスのレップ数
-        idx==9: 選手の垂直跳びの記録
-        idx==10: 選手の立ち幅跳びの記録
-        idx==11: 選手のシャトル走の記録
-        idx==12: 選手の3 cone drillの記録
-        idx==13: 選手の60yd シャトル走の記録
-
-        長さを表す記録にはインチを表す'"'と言う表記が入っているが、出力する時に不要なので配列に追加する前に消去する。
-        その他記録は、数値と単位の間にスペースが入っているため、split()してから最初のentryを選択する。
-        情報が記録されていないものに関しては、'(N/A)'というテキストが入っているため、その場合は配列に'None'を追加する
-
-        """
-        children = stat.select('td')
-        if idx == 1:
-            height = children[1].get_text()
-
-            num_height_list = [num for num in height if num != "\""]
-            num_height = "".join(num_height_list)
-            if num_height == '(N/A)':
-                heights.append(None)
-            else:
-                heights.append(float(num_height))
-
-        elif idx == 2:
-            weight = children[1].get_text()
-            num_weight = weight.split()[0]
-            if num_weight == '(N/A)':
-                weights.append(None)
-            else:
-                weights.append(float(num_weight))
-        elif idx == 3:
-            hand_size = children[1].get_text()
-            num_hand_size_list = [num for num in hand_size if num != "\""]
-            num_hand_size = ''.join(num_hand_size_list)
-            if num_hand_size == '(N/A)':
-                hand_sizes.append(None)
-            else:
-                hand_sizes.append(float(num_hand_size))
-
-        elif idx == 4:
-            arm_length = children[1].get_text()
-            num_arm_length_list = [num for num in arm_length if num != "\""]
-            num_arm_length = ''.join(num_arm_length_list)
-            if num_arm_length == '(N/A)':
-                arm_lengths.append(None)
-            else:
-                arm_lengths.append(float(num_arm_length))
-
-        elif idx == 5:
-            forty_time = children[1].get_text()
-            num_forty_time = forty_time.split()[0]
-            if num_forty_time == "(N/A)":
-                forty_times.append(None)
-            else:
-                forty_times.append(float(num_forty_time))
-        elif idx == 6:
-            twenty_time = children[1].get_text()
-            num_twenty_time = twenty_time.split()[0]
-            if num_twenty_time == "(N/A)":
-                twenty_times.append(None)
-            else:
-                twenty_times.append(float(num_twenty_time))
-        elif idx == 7:
-            ten_time = children[1].get_text()
-            num_ten_time = ten_time.split()[0]
-            if num_ten_time == "(N/A)":
-                ten_times.append(None)
-            else:
-                ten_times.append(float(num_ten_time))
-        elif idx == 8:
-            bench = children[1].get_text()
-            num_bench = bench.split()[0]
-            if num_bench == "(N/A)":
-                benches.append(None)
-            else:
-                benches.append(int(num_bench))
-        elif idx == 9:
-            vertical = children[1].get_text()
-            num_vertical_list = [num for num in vertical if num != "\""]
-            num_vertical = ''.join(num_vertical_list)
-            if num_vertical == '(N/A)':
-                verticals.append(None)
-            else:
-                verticals.append(float(num_vertical))
-        elif idx == 10:
-            broad = children[1].get_text()
-            num_broad_list = [num for num in broad if num != "\""]
-            num_broad = ''.join(num_broad_list)
-            if num_broad == "(N/A)":
-                broads.append(None)
-            else:
-                broads.append(float(''.join(num_broad)))
-        elif idx == 11:
-            shuttle = children[1].get_text()
-            num_shuttle = shuttle.split()[0]
-            if num_shuttle == "(N/A)":
-                shuttles.append(None)
-            else:
-                shuttles.append(float(num_shuttle))
-        elif idx == 12:
-            three_cone = children[1].get_text()
-            num_cone = three_cone.split()[0]
-            if num_cone == "(N/A)":
-                three_cones.append(None)
-            else:
-                three_cones.append(float(num_cone))
-        elif idx == 13:
-            sixty_shuttle = children[1].get_text()
-            num_sixty_shuttle = sixty_shuttle.split()[0]
-            if num_sixty_shuttle == "(N/A)":
-                sixty_yard_shuttles.append(None)
-            else:
-                sixty_yard_shuttles.append(float(num_sixty_shuttle))
-
-         ####### college stats #######
-
-    stats_file_name = '{}-{}-{}-stats.html'.format(
-        first_name.lower(), last_name.lower(), draft_year)
-    stats_base_path = 'crawl_exports/college_stats/'
-    stats_file_path = os.path.join(stats_base_path, stats_file_name)
-    stats_content = open(stats_file_path, mode="r",
-                         encoding="ascii", errors="ignore").read()
-    stats_soup = bs(stats_content, "html.parser")
+    record = PlayerRecord(college=college, draft_year=draft_year, player=player_name)
 
-    # draft round
-    """
-    2020,2019にドラフトされた選手は
-    """
-    if draft_year in [2020, 2019]:
-        if player_name in recent_player_names:
-            draft_round.append(
-                recent_draft_round[recent_player_names.index(player_name)])
-        else:
-            draft_round.append(0)
+    stats_content = store.get(KIND_STATS, key)
+    if stats_content is None:
+        run_metrics.inc('scrape_missing_pages_total', kind=KIND_STATS)
+        for _, _, last_year_attribute, career_attribute in table_stats:
+            setattr(record, last_year_attribute, None)
+            setattr(record, career_attribute, None)
+        return record
 
-    else:
-        meta = stats_soup.find(id='meta')
-        str_meta = str(meta)
-        if 'Draft' in str_meta:
-            draft_round.append(int(str_meta[str_meta.index('Draft')+16]))
-        else:
-            draft_round.append(0)
-
-    # receiving yards
-    if stats_soup.find(id='receiving') is not None:
-        last_year_rec.append(stats_soup.find(id='receiving').select_one(
-            'tbody').select('tr')[-1].select('td')[7].get_text())
-        career_rec.append(stats_soup.find(id='receiving').select_one(
-            'tfoot').select('td')[7].get_text())
-        total_last_year_rec.append(stats_soup.find(id='receiving').select_one(
-            'tbody').select('tr')[-1].select('td')[6].get_text())
-        total_career_rec.append(stats_soup.find(id='receiving').select_one(
-            'tfoot').select('td')[6].get_text())
-
-    else:
-        last_year_rec.append(0)
-        career_rec.append(0)
-        total_last_year_rec.append(0)
-        total_career_rec.append(0)
-
-    # returning yards
-    # returning yards はコメントに覆われてたので、少し手間を加える。
-    comments = stats_soup.find_all(
-        string=lambda text: isinstance(text, Comment))
-    kick_ret_table = None
-    for comment in comments:
-        comment = bs(str(comment), 'html.parser')
-        kick_ret_table = comment.find(id='kick_ret')
-        if kick_ret_table:
-            break
-
-    if kick_ret_table:
-        last_year_return.append(kick_ret_table.select_one(
-            'tbody').select('tr')[-1].select('td')[7].get_text())
-        career_return.append(kick_ret_table.select_one(
-            'tfoot').select('td')[7].get_text())
-    else:
-        last_year_return.append(0)
-        career_return.append(0)
-
-
-def get_player_name_and_round():
-    """
-        return:
-            player_name_list: 2020,2019年にドラフトされた選手を含む配列
-            drafted_rounds: 2020,2019年にドラフトされた選手のドラフト巡を含む配列
+    # 以前ファイルから読んでいたときと同じく、ascii以外の文字は捨てる。
+    stats_tables = parse_stats_page(stats_content.encode('ascii', 'ignore').decode('ascii'))
 
-        2019年以前の選手は、大学の戦績が載ったページにドラフト巡が載っているが、2019,2020年の選手は載っていない。
-        そのため、別途クロールしてきた"draft_page.html"からドラフトラウンドを取得する。
-    """
+    # draft round
+    # インデックスで見つからなかったときのために#metaから読んでおく。
+    record.draft_round = round_from_meta(stats_tables['meta'])
 
-    draft_page = open('crawl_exports/draft_page.html', 'r').read()
-    page_soup = bs(draft_page, 'html.parser')
+    # receiving, kick returns, punt returns, rushing, defense
+    for table_id, position, last_year_attribute, career_attribute in table_stats:
+        if stats_tables[table_id] is None:
+            continue
+        last_year_tds, career_tds = stats_tables[table_id]
+        setattr(record, last_year_attribute,
+                last_year_tds[position] if last_year_tds is not None and len(last_year_tds) > position else None)
+        setattr(record, career_attribute,
+                career_tds[position] if career_tds is not None and len(career_tds) > position else None)
 
-    # ドラフト年、ドラフト巡が記載されたテーブルを取り出す。
-    tbody = page_soup.find(id='results').select_one('tbody')
+    return record
 
-    # 選手名、ドラフト巡を保存しておくための配列を作成
-    player_name_list = list()
-    drafted_rounds = list()
 
-    if tbody is not None:
-        for row in tbody.select('tr'):
-            if row.get('class') is None:  # 取得した行のclassに何か指定されていると、それはデータを含まない行なので飛ばす。
-                # 一番最初の'td'にドラフト年が入っているので、それが2020か2019の場合は次に進む。
-                if row.select_one('td').get_text() in ['2020', '2019']:
-                    tds = row.select('td')
-                    # 2つ目のtdにドラフト巡、4つ目のtdに名前が入っている。
-                    player_name_list.append(tds[3].select_one('a').get_text().replace(
-                        'Jr', '').replace('III', '').strip())  # 比較する選手の名前が入った配列にヒア、名前に'Jr.'や 'III'などと行った表記はないためここで省く。
-                    drafted_rounds.append(tds[1].get_text())
+def scrape_batch(players, draft_index_path=default_draft_index_path, store_path=page_store_path, cache_path=record_cache_path):
+    """
+    parameters:
+        players: (draft_year, player_name, college) の配列
+        cache_path: parse済みレコードのキャッシュ(record_cache)。Noneの場合はキャッシュを使わずに全員parseする。
+    returns:
+        playersの順番どおりのPlayerRecordの配列
+
+    ページはcrawlerが保存したページストア(store_path)から、ドラフト巡はdraft_index(draft_index_path)から読む。
+    2つのページのハッシュがキャッシュと同じ選手はparseせず、ページが変わった選手だけparseしてキャッシュを更新する。
+    Combineの結果は全員分の値の文字列を集めてから、combine_fields.convert_values()でまとめて数値にする。
+    グローバルな状態は持たないので、別プロセスで並列に呼び出せる。
+    """
+    store = get_store(store_path)
+    cache = get_cache(cache_path) if cache_path is not None else None
+    records = list()
+    # parseした選手: (recordsの位置, キー, Combineのページのハッシュ, 戦績ページのハッシュ)
+    parsed = list()
+    raw_rows = list()
+    for draft_year, player_name, college in players:
+        key = player_key(player_name, draft_year, college)
+        hashes = (None, None)
+        if cache is not None:
+            hashes = (store.hash_of(KIND_COMBINE, key), store.hash_of(KIND_STATS, key))
+            record = cache.get(key, *hashes)
+            if record is not None:
+                records.append(record)
+                continue
+        parsed.append((len(records), key) + hashes)
+        ####### combine stats #######
+        # 見出しで行を探すので、行の並びが変わっても値がずれない。
+        # crawlに失敗してページがない選手は、Combineの項目を全てNoneにする。
+        combine_content = store.get(KIND_COMBINE, key)
+        if combine_content is None:
+            run_metrics.inc('scrape_missing_pages_total', kind=KIND_COMBINE)
+            raw_rows.append(dict())
+        else:
+            raw_rows.append(raw_values(parse_combine_page(combine_content)))
+        ####### college stats #######
+        records.append(scrape_college_stats(store, key, draft_year, player_name, college))
+
+    for (position, *_), combine_values in zip(parsed, convert_values(raw_rows)):
+        for attribute, value in combine_values.items():
+            setattr(records[position], attribute, value)
+    if cache is not None and parsed:
+        cache.put_many([(key, combine_hash, stats_hash, records[position])
+                        for position, key, combine_hash, stats_hash in parsed])
+
+    # ドラフト検索ページから作ったインデックスを引く。インデックスになければ#metaから読んだ値のまま。
+    draft_index = get_draft_index(draft_index_path)
+    for record in records:
+        record.draft_round = draft_index.lookup(record.player, record.draft_year, record.college) or record.draft_round
+    return records
+
+
+def scraper(draft_year, player_name, college, draft_index_path=default_draft_index_path, store_path=page_store_path,
+            cache_path=record_cache_path):
+    """
+    選手1人分をscrapeして、records.PlayerRecordを返す。
+    """
+    return scrape_batch([(draft_year, player_name, college)], draft_index_path, store_path, cache_path)[0]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Scrape crawled combine results and college stats into output.csv.')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of scraper processes (default: number of CPUs, 0 scrapes in this process)')
+    parser.add_argument('--parquet-dir', default=None,
+                        help='also write typed Parquet output partitioned by DraftYear to this directory')
+    parser.add_argument('--chunk-size', type=int, default=default_chunk_size,
+                        help='number of records written per committed output chunk')
+    parser.add_argument('--restart', action='store_true',
+                        help='ignore chunks left by an interrupted run and start over')
+    parser.add_argument('--cache', default=record_cache_path,
+                        help='cache of parsed records keyed by page hash; only changed pages are parsed again')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='parse every page and leave the record cache untouched')
+    metrics.add_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def scrape_batch_with_metrics(players, **kwargs):
+    """
+        scrape_batch()を実行し、(PlayerRecordの配列, このプロセスで記録した計測値) を返す。
+    """
+    with run_metrics.timer('scrape_batch_seconds'):
+        records = scrape_batch(players, **kwargs)
+    return records, run_metrics.drain()
 
-    return player_name_list, drafted_rounds
 
+def iter_scrape_batches(players, workers=None, draft_index_path=default_draft_index_path, store_path=page_store_path, batch_size=None,
+                        cache_path=record_cache_path):
+    """
+        parameters:
+            players: (draft_year, player_name, college) の配列
+            batch_size: 1つのワーカーにまとめて渡す選手の数。Noneの場合は選手数とワーカー数から決める。
+            cache_path: scrape_batch()に渡すレコードのキャッシュ。Noneの場合はキャッシュを使わない。
+        yields:
+            バッチごとのPlayerRecordの配列。playersの順番どおりに返す。
+
+        選手をバッチに分け、scrape_batch()を複数プロセスで並列に実行する。
+        workersが0の場合はこのプロセスで順番に実行する。cProfileでparseを見たいときに使う。
+    """
+    # プロセス間の受け渡しの回数を減らし、Combineの値の変換もまとめて行えるように、何人かずつまとめてワーカーに渡す。
+    batch_size = batch_size or max(1, len(players) // ((workers or os.cpu_count() or 1) * 4))
+    batches = [players[i:i + batch_size] for i in range(0, len(players), batch_size)]
+
+    if workers == 0:
+        for batch in batches:
+            with run_metrics.timer('scrape_batch_seconds'):
+                yield scrape_batch(batch, draft_index_path, store_path, cache_path)
+        return
+
+    scrape = partial(scrape_batch_with_metrics, draft_index_path=draft_index_path,
+                     store_path=store_path, cache_path=cache_path)
+    # pandas/pyarrowがスレッドを立てた後のプロセスをforkすると終了時に落ちることがあるので、spawnでワーカーを起動する。
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        for batch_records, worker_metrics in executor.map(scrape, batches):
+            run_metrics.merge(worker_metrics)
+            yield batch_records
+
+
+def scrape(args):
+    """
+        コマンドラインの引数に従ってscrapeし、output.csvに書き出す。
+        レコードはchunk_size件ごとにチャンクとして書き出すので、メモリは選手数によらず一定になる。
+        途中で落ちた場合は、次のrunで書き出し済みのチャンクの続きから再開する。
+        ページが変わっていない選手はrecord_cacheのレコードを使うので、parseするのはページが更新された選手だけになる。
+    """
+    from tqdm import tqdm
 
-def main():
-    recent_player_names, recent_draft_round = get_player_name_and_round()
+    # ドラフトページが更新されていればインデックスを作り直し、ワーカーが読めるように保存しておく。
+    with run_metrics.span('draft_index'):
+        load_or_build_draft_index()
 
     draft_year_list, player_name_list, colleges = read_name_year_college()
-
-    # プログレスバーの設定
-    with tqdm(total=len(player_name_list)) as pbar:
-        for idx, (draft_year, player_name) in enumerate(zip(draft_year_list, player_name_list)):
-            scraper(draft_year, player_name,
-                    recent_player_names, recent_draft_round)
-            pbar.update(1)
-
-    data_dict = {'Height': heights, 'Weight': weights, 'HandSize': hand_sizes, 'ArmLength': arm_lengths, 'FortyTime': forty_times, 'TwentyTime': twenty_times, 'TenTime': ten_times, 'Bench': benches, 'Vertical': verticals, 'BroadJump': broads, 'Shuttle': shuttles, 'ThreeCone': three_cones, 'SixtyShuttle': sixty_yard_shuttles,
-                 'LastYearRecAvg': last_year_rec, 'CareerRecAvg': career_rec, 'LastYearReturnAvg': last_year_return, 'CareerReturnAvg': career_return, 'DraftRound': draft_round, 'College': colleges, 'DraftYear': draft_year_list, 'CareerRec': total_career_rec, 'LastYearRec': total_last_year_rec}
-    data_df = pd.DataFrame(data_dict)
-
-    data_df.to_csv('output.csv', index=False)
-
-
-main()
+    players = list(zip(draft_year_list, player_name_list, colleges))
+
+    writer = ChunkedWriter(chunk_size=args.chunk_size, parquet_dir=args.parquet_dir,
+                           fingerprint=input_fingerprint(players))
+    done = writer.start_over() if args.restart else writer.resume()
+    if done:
+        print('Resuming after {} players already written'.format(done))
+
+    with run_metrics.span('scrape'):
+        with tqdm(total=len(players), initial=done) as pbar:
+            # 1チャンクより大きいバッチにならないようにする。
+            batch_size = min(args.chunk_size, max(1, (len(players) - done) // ((args.workers or os.cpu_count() or 1) * 4)))
+            for batch_records in iter_scrape_batches(players[done:], args.workers, batch_size=batch_size,
+                                                     cache_path=None if args.no_cache else args.cache):
+                writer.add(batch_records)
+                pbar.update(len(batch_records))
+
+    with run_metrics.span('write'):
+        writer.close('output.csv')
+
+    if not args.no_cache:
+        counters = run_metrics.snapshot()['counters']
+        print('Parsed {} players with changed pages, {} unchanged from the record cache'.format(
+            counters.get(('record_cache_misses_total', ()), 0), counters.get(('record_cache_hits_total', ()), 0)))
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    metrics.configure(args.profile_dir)
+    try:
+        scrape(args)
+    finally:
+        if args.metrics is not None:
+            run_metrics.write_report(args.metrics)
+
+
+if __name__ == '__main__':
+    main()
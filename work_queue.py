@@ -0,0 +1,163 @@
+"""
+-----------------------------------------------------------------------
+-- Crawlのワークキュー -------------------------------------------------
+-----------------------------------------------------------------------
+
+    全ポジション・全年のcrawlを (ドラフト年, ポジション) ごとのシャードに分け、SQLiteのキューに積む。
+    複数のcrawlerプロセスが同じキューからシャードを取り合っても、1つのシャードは1つのプロセスしか処理しない。
+        - claim(): 未処理のシャード(または期限切れになったシャード)を1つ取って、自分のものにする。
+        - renew(): 処理中のシャードの期限を延ばす。crawlの途中で定期的に呼ぶ。
+        - complete(): 処理が終わったシャードを'done'にする。
+        - fail(): 失敗したシャードを'pending'に戻す。max_attempts回失敗したら'failed'にする。
+    シャードを取ったプロセスが落ちても、lease_seconds が過ぎれば他のプロセスが取り直せる。
+    renew()、complete()、fail()はシャードを今持っているプロセス(owner)のときだけ効く。
+    期限が切れて他のプロセスに取り直されたシャードには何もせずFalseを返すので、呼び出し側はそのシャードの処理をやめること。
+
+    複数のマシンで使う場合は、キューのファイルをロックが正しく効く共有ファイルシステムに置くこと。
+
+-----------------------------------------------------------------------
+-----------------------------------------------------------------------
+
+
+"""
+
+# Imports
+import os
+import socket
+import sqlite3
+import time
+
+queue_path = './crawl_exports/work_queue.sqlite3'
+
+# nflcombineresults.comのポジションと、pro-football-referenceのドラフト検索で使うポジションの対応
+positions = {
+    'QB': 'qb',
+    'RB': 'rb',
+    'FB': 'fb',
+    'WR': 'wr',
+    'TE': 'te',
+    'OT': 't',
+    'OG': 'g',
+    'OC': 'c',
+    'DE': 'de',
+    'DT': 'dt',
+    'ILB': 'ilb',
+    'OLB': 'olb',
+    'SS': 's',
+    'FS': 's',
+    'CB': 'cb',
+    'LS': 'ls',
+    'PK': 'k',
+    'P': 'p',
+}
+
+STATUS_PENDING = 'pending'
+STATUS_CLAIMED = 'claimed'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+
+def default_owner():
+    """
+        シャードを取ったプロセスを識別する名前。"{ホスト名}:{pid}"
+    """
+    return '{}:{}'.format(socket.gethostname(), os.getpid())
+
+
+class WorkQueue:
+    """
+        parameters:
+            path: キューのSQLiteファイルのパス
+            lease_seconds: シャードを取ってからこの秒数が過ぎても終わっていなければ、他のプロセスが取り直せる
+            max_attempts: この回数失敗したシャードは'failed'にして、もう配らない
+    """
+
+    def __init__(self, path=queue_path, lease_seconds=3600, max_attempts=3):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # claim()で明示的にトランザクションを張るので、autocommitにしておく。
+        self.conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS shards (
+                year INTEGER NOT NULL,
+                pos TEXT NOT NULL,
+                status TEXT NOT NULL,
+                owner TEXT,
+                claimed_at REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (year, pos)
+            )""")
+
+    def plan(self, years, shard_positions=None):
+        """
+            years × positions のシャードをキューに積み、新しく積んだシャードの数を返す。
+            すでに積まれているシャードはそのままにする。
+        """
+        shard_positions = shard_positions or list(positions)
+        unknown = [pos for pos in shard_positions if pos not in positions]
+        if unknown:
+            raise ValueError('unknown positions: {}'.format(', '.join(unknown)))
+        before = self.conn.total_changes
+        self.conn.execute('BEGIN IMMEDIATE')
+        self.conn.executemany('INSERT OR IGNORE INTO shards (year, pos, status) VALUES (?, ?, ?)',
+                              [(year, pos, STATUS_PENDING) for year in years for pos in shard_positions])
+        self.conn.execute('COMMIT')
+        return self.conn.total_changes - before
+
+    def claim(self, owner=None):
+        """
+            シャードを1つ取って (year, pos) を返す。残っていなければNone。
+        """
+        owner = owner or default_owner()
+        now = time.time()
+        # BEGIN IMMEDIATEで書き込みロックを取ってから探すので、同じシャードを2つのプロセスが取ることはない。
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = self.conn.execute(
+                'SELECT year, pos FROM shards WHERE status = ? OR (status = ? AND claimed_at < ?) '
+                'ORDER BY year DESC, pos LIMIT 1',
+                (STATUS_PENDING, STATUS_CLAIMED, now - self.lease_seconds)).fetchone()
+            if row is not None:
+                self.conn.execute('UPDATE shards SET status = ?, owner = ?, claimed_at = ?, attempts = attempts + 1 '
+                                  'WHERE year = ? AND pos = ?', (STATUS_CLAIMED, owner, now, row[0], row[1]))
+            self.conn.execute('COMMIT')
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+        return None if row is None else (row[0], row[1])
+
+    def _update_owned(self, sql, params, year, pos, owner):
+        cursor = self.conn.execute(sql + ' WHERE year = ? AND pos = ? AND status = ? AND owner = ?',
+                                   params + (year, pos, STATUS_CLAIMED, owner or default_owner()))
+        return cursor.rowcount == 1
+
+    def renew(self, year, pos, owner=None):
+        """
+            シャードの期限を今からlease_seconds後まで延ばす。他のプロセスに取り直されていればFalseを返す。
+        """
+        return self._update_owned('UPDATE shards SET claimed_at = ?', (time.time(),), year, pos, owner)
+
+    def complete(self, year, pos, owner=None):
+        return self._update_owned('UPDATE shards SET status = ?, claimed_at = ?', (STATUS_DONE, time.time()),
+                                  year, pos, owner)
+
+    def fail(self, year, pos, owner=None):
+        return self._update_owned('UPDATE shards SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, owner = NULL',
+                                  (self.max_attempts, STATUS_FAILED, STATUS_PENDING), year, pos, owner)
+
+    def status_counts(self):
+        """
+            statusごとのシャード数をdictで返す。
+        """
+        return dict(self.conn.execute('SELECT status, COUNT(*) FROM shards GROUP BY status').fetchall())
+
+    def done_shards(self):
+        return self.conn.execute('SELECT year, pos FROM shards WHERE status = ? ORDER BY year, pos',
+                                 (STATUS_DONE,)).fetchall()
+
+    def close(self):
+        self.conn.close()